@@ -2,9 +2,10 @@
 
 __version__ = "0.1.20"
 
-from .problem import Problem, TestFileBase, Subproblem
+from .problem import PackLimit, Problem, TestFileBase, Subproblem
 from .contest import Contest
 from .runner import *
 from .cli import run_cli
 
-from .multicase import TestCaseBase, MulticaseTestFile
+from .multicase import CaseTable, TestCaseBase, MulticaseTestFile
+from .validator import InputReader, ValidationError
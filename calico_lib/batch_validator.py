@@ -0,0 +1,45 @@
+"""
+Batch mode for python validators, used by Runner.validate_files.
+
+    python -m calico_lib.batch_validator <validator.py> < paths
+
+The validator is compiled and its top level imports are imported once. Then for each
+path read from stdin (one per line), a forked child runs the validator as __main__
+with the file as stdin, the same as `python validator.py < path`. One JSON line is
+printed per path: {"ok": bool, "message": str}, the message being the end of the
+stderr of the validator.
+"""
+import json
+import os
+import sys
+import tempfile
+
+from calico_lib.runner import _MESSAGE_LIMIT
+from calico_lib.warm_worker import _load, _run_child
+
+def validate(code, src_path: str, path: str) -> dict:
+    if not os.path.isfile(path):
+        return {'ok': False, 'message': f'{path} not found'}
+    with open(path, 'rb') as stdin, \
+            open(os.devnull, 'wb') as stdout, \
+            tempfile.TemporaryFile() as stderr:
+        sys.stdout.flush()
+        pid = os.fork()
+        if pid == 0:
+            os.dup2(stderr.fileno(), 2)
+            _run_child(code, src_path, stdin.fileno(), stdout.fileno(), None, None)
+        _, status = os.waitpid(pid, 0)
+        stderr.seek(0)
+        message = stderr.read().decode(errors='replace').strip()[-_MESSAGE_LIMIT:]
+    return {'ok': os.waitstatus_to_exitcode(status) == 0, 'message': message}
+
+def main():
+    src_path = sys.argv[1]
+    code = _load(src_path)
+    for line in sys.stdin:
+        path = line.rstrip('\n')
+        if path:
+            print(json.dumps(validate(code, src_path, path)), flush=True)
+
+if __name__ == '__main__':
+    main()
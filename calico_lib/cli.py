@@ -1,11 +1,12 @@
+import logging
 import os
-import shutil
 import sys
 
 from calico_lib.config import load_secrets, load_configs
 from .contest import Contest
-from .judge_api import set_contest_id, set_user
+from .judge_api import print_metrics_summary, set_contest_id, set_max_concurrency, set_user
 from .problem import Problem
+from .schedule import Task, print_report, run_tasks
 import argparse
 
 
@@ -28,6 +29,19 @@ def run_cli(obj: Contest|Problem):
     parser.add_argument('-l', '--link', action='store_true', help='Link the problem to the contest.')
     # parser.add_argument('-L', '--unlink', action='store_true', help='Unlink the problem from the contest.')
     parser.add_argument('-s', '--skip-test-gen', action='store_true', help='Skip test generation.')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='Number of processes used to generate tests.')
+    parser.add_argument('--clean', action='store_true', help='Delete all existing tests and regenerate them, instead of only the changed ones.')
+    parser.add_argument('--usage-fraction', type=float, default=0.5, help='Report tests where the solution uses more than this fraction of a subproblem\'s time or memory limit.')
+    parser.add_argument('-v', '--verify', action='store_true', help='Run all submissions against the tests and check their verdicts before zipping.')
+    parser.add_argument('--calibrate', action='store_true', help='Recommend time limits based on the running time of accepted submissions.')
+    parser.add_argument('--apply-time-limits', action='store_true', help='With --calibrate, use the recommended time limits in the zips.')
+    parser.add_argument('--tl-multiplier', type=float, default=2.0, help='Time limit calibration: multiplier applied to the slowest accepted time.')
+    parser.add_argument('--tl-margin', type=float, default=0.0, help='Time limit calibration: seconds added after the multiplier.')
+    parser.add_argument('--zip-level', type=int, default=6, help='Compression level (0-9) of the problem zips.')
+    parser.add_argument('-j', '--jobs', type=int, default=4, help='Number of stages (tests, zips, uploads...) run at once, also the number of concurrent requests to the judge.')
+    parser.add_argument('--force-upload', action='store_true', help='Upload zips even if they are unchanged since the last upload.')
+    parser.add_argument('-q', '--quiet', action='store_true', help='Only log judge requests that fail.')
+    parser.add_argument('--verbose', action='store_true', help='Also log judge responses.')
     parser.add_argument('-f', '--final', action='store_true', help='Don\'t append _draft to the problem id.')
     # parser.add_argument('-i', '--p-ord', type=int, help='Problem order.')
 
@@ -38,7 +52,7 @@ def run_cli(obj: Contest|Problem):
                 )
         parser.add_argument(
                 '-z', '--contest-zip', action='store_true',
-                help="Create the contest folder, used for creating contest.zip."
+                help="Create contest.zip, with the sample data and templates of each problem."
                 )
         parser.add_argument(
                 '-p', '--target-problem', type=str,
@@ -53,12 +67,21 @@ def run_cli(obj: Contest|Problem):
         load_configs('../config.toml')
 
     args = parser.parse_args()
+
+    log_level = logging.INFO
+    if args.quiet:
+        log_level = logging.WARNING
+    elif args.verbose:
+        log_level = logging.DEBUG
+    logging.basicConfig(format='%(message)s')
+    logging.getLogger('calico_lib').setLevel(log_level)
     # if isinstance(obj, Contest) and len(sys.argv) == 1:
     #     parser.print_help()
     #     return
 
     if isinstance(obj, Contest) and args.create:
         obj.create_contest()
+        print_metrics_summary()
         return
 
     target_problems = None
@@ -80,20 +103,82 @@ def run_cli(obj: Contest|Problem):
         set_contest_id(args.cid)
 
     assert target_problems is not None
+    set_max_concurrency(args.jobs)
+
+    contest_zip_path = os.path.abspath('contest.zip')
+    # compressed files of each problem in contest.zip, by problem
+    contest_zip_entries = {}
+    contest_files_tasks = []
+
+    register_task = None
+    if args.upload and isinstance(obj, Contest):
+        contest = obj
+        register_task = Task('Creating missing problems',
+                             lambda: contest.register_missing_problems(target_problems))
+
+    def problem_tasks(target_problem: Problem) -> list[Task]:
+        """The stages of target_problem, each depending on the previous one."""
+        name = target_problem.problem_name
+        tasks = []
+        last = None
+        def add(stage: str, fn, deps: list[Task], exclusive: bool = False):
+            task = Task(f'{name}: {stage}', fn, deps, exclusive)
+            tasks.append(task)
+            return task
+
+        tests = None
+        if not args.skip_test_gen and not target_problem.always_skip_test_gen:
+            compile_task = add('compile', lambda: target_problem.compile_runners(args.workers), [])
+            def create_tests():
+                target_problem.create_all_tests(args.workers, args.clean)
+                target_problem.usage_report(args.usage_fraction)
+            # generating on several processes forks, which is only safe while no other
+            # stage runs in another thread
+            tests = last = add('tests', create_tests, [compile_task], args.workers > 1)
+
+        if args.calibrate:
+            last = add('calibrate', lambda: target_problem.calibrate_time_limits(
+                    args.workers,
+                    multiplier=args.tl_multiplier,
+                    margin=args.tl_margin,
+                    apply=args.apply_time_limits), [last] if last else [])
+
+        if args.verify:
+            def verify():
+                assert target_problem.verify_submissions(args.workers), \
+                        f'Submission verification failed for {target_problem.problem_name}'
+            last = add('verify', verify, [last] if last else [])
 
-    zip_dir_name = 'contest_zip_stuff'
+        if not args.skip_test_gen:
+            last = add('zip', lambda: target_problem.create_zip('', args.zip_level, args.workers),
+                       [last] if last else [])
 
-    if isinstance(obj, Contest) and args.contest_zip:
-        try:
-            shutil.rmtree(zip_dir_name)
-        except FileNotFoundError:
-            # First time running
-            pass
-        os.makedirs(zip_dir_name)
+        if isinstance(obj, Contest) and args.contest_zip:
+            contest = obj
+            def compress_contest_files():
+                contest_zip_entries[id(target_problem)] = contest.contest_zip_entries(
+                        target_problem, args.zip_level)
+            contest_files_tasks.append(
+                    add('contest files', compress_contest_files, [tests] if tests else []))
+
+        if args.upload:
+            deps = [last] if last else []
+            if register_task is not None:
+                deps.append(register_task)
+            last = add('upload', lambda: target_problem.upload(args.jobs, args.force_upload), deps)
+
+        # if args.unlink:
+        #     assert not args.link
+        #     print('=== Unlinking from Contest ===')
+        #     target_problem.link_to_contest()
+        if args.link:
+            add('link', lambda: target_problem.link_to_contest(args.jobs),
+                [last] if args.upload else [])
+        return tasks
 
+    all_tasks = [register_task] if register_task is not None else []
+    tasks_of = {}
     for target_problem in target_problems:
-        print(f'======\n---> Operating on {target_problem.problem_name}\n======')
-        os.chdir(target_problem.problem_dir)
         target_problem.init_problem()
 
         if args.final:
@@ -103,38 +188,37 @@ def run_cli(obj: Contest|Problem):
             assert target_problem.ordinal != -1
         else:
             target_problem.problem_name = target_problem.problem_name + '_draft'
+        tasks_of[id(target_problem)] = problem_tasks(target_problem)
+        all_tasks += tasks_of[id(target_problem)]
 
-        if not args.skip_test_gen:
-            if not target_problem.always_skip_test_gen:
-                print('\n=== Creating Tests ===')
-                target_problem.create_all_tests()
-
-            print('\n=== Creating Zip ===')
-            target_problem.create_zip('')
-
-        def ignore(path, names):
-            # print(path, names)
-            inc = ['./data/sample', './templates']
-            if path == '.':
-                return [name for name in names if name not in ['data', 'templates']]
-            if path == './data':
-                return [name for name in names if name not in ['sample']]
-            if path in inc:
-                return []
-            return names
-        if isinstance(obj, Contest) and args.contest_zip:
-            shutil.copytree('.', f'../{zip_dir_name}/{target_problem.problem_name}', ignore=ignore)
+    if isinstance(obj, Contest) and args.contest_zip:
+        contest = obj
+        # written in one pass once the files of every problem are compressed
+        all_tasks.append(Task('contest zip', lambda: contest.write_contest_zip(
+                contest_zip_path,
+                [contest_zip_entries[id(target_problem)] for target_problem in target_problems]),
+                contest_files_tasks))
 
-        if args.upload:
-            print('=== Uploading Problem Zip ===')
-            target_problem.upload()
+    # Stages of different problems overlap, a failure only stops the stages after it
+    ok = run_tasks(all_tasks, args.jobs)
 
-        # if args.unlink:
-        #     assert not args.link
-        #     print('=== Unlinking from Contest ===')
-        #     target_problem.link_to_contest()
-        if args.link:
-            print('=== Linking to Contest ===')
-            target_problem.link_to_contest()
+    if args.upload or args.link:
+        print('\n=== Judge Requests ===')
+        print_metrics_summary()
+
+    print('\n=== Summary ===')
+    for target_problem in target_problems:
+        tasks = tasks_of[id(target_problem)]
+        if register_task is not None:
+            tasks = [register_task] + tasks
+        status = 'OK'
+        for task in tasks:
+            if task.status != 'ok':
+                status = f'{task.status.upper()} ({task.name})'
+                break
+        print(f'{target_problem.problem_name}: {status}')
+    print_report(all_tasks)
+    if not ok:
+        sys.exit(1)
 
 Problem._cli_func = run_cli
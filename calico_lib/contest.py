@@ -1,11 +1,17 @@
 import argparse
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from datetime import datetime
+import os
 from typing import List, Literal
 
 from .judge_api import create_contest, set_contest_id
 from .problem import Problem
-from calico_lib import judge_api
+from calico_lib import judge_api, zipbuild
+
+# Folders of each problem included in contest.zip
+CONTEST_ZIP_FOLDERS = [os.path.join('data', 'sample'), 'templates']
 
 @dataclass
 class Contest():
@@ -15,6 +21,62 @@ class Contest():
     duration: str = '9999999:00:00'
     problems: List[Problem] = field(default_factory=list)
 
+    def register_missing_problems(self, problems: List[Problem]|None = None):
+        """
+        Create all test sets of problems (by default all problems of the contest) that
+        don't exist on the judge yet, with a single request. Only the metadata is
+        added, the zips are uploaded by Problem.upload.
+        """
+        if problems is None:
+            problems = self.problems
+        missing = []
+        for problem in problems:
+            missing += problem.missing_metadata()
+        if missing:
+            judge_api.add_problems_metadata_to_contest(missing)
+        # The new problems have no zip, whatever was uploaded before
+        pids = [pid for pid, _, _ in missing]
+        for problem in problems:
+            problem.forget_uploads(pids)
+
+    def contest_zip_entries(self, problem: Problem, level: int = 6) -> list[zipbuild.CompressedEntry]:
+        """
+        The sample data and templates of problem (see CONTEST_ZIP_FOLDERS), compressed,
+        in a folder named after the problem.
+        """
+        entries = []
+        for folder in CONTEST_ZIP_FOLDERS:
+            for path in zipbuild.list_files(os.path.join(problem.problem_dir, folder)):
+                arcname = os.path.join(problem.problem_name, os.path.relpath(path, problem.problem_dir))
+                entries.append(zipbuild.compress_file(path, arcname, level))
+        return entries
+
+    def create_contest_zip(self,
+                           zip_path: str = 'contest.zip',
+                           problems: List[Problem]|None = None,
+                           level: int = 6,
+                           workers: int = 1):
+        """
+        Write contest.zip with the sample data and templates of problems (by default all
+        problems of the contest), compressing problems on workers threads. Files are
+        written straight from the problem directories, in a single pass.
+        """
+        if problems is None:
+            problems = self.problems
+        with ThreadPoolExecutor(workers) as pool:
+            entries = pool.map(lambda problem: self.contest_zip_entries(problem, level), problems)
+            self.write_contest_zip(zip_path, entries)
+
+    def write_contest_zip(self,
+                          zip_path: str,
+                          entries_by_problem: Iterable[list[zipbuild.CompressedEntry]]):
+        """
+        Write the contest zip from the contest_zip_entries of each problem, in the order
+        of the problems.
+        """
+        zipbuild.write_zip(zip_path, [entry for entries in entries_by_problem for entry in entries])
+        print(f'Wrote {zip_path}')
+
     def create_contest(self):
         create_contest(self.contest_id, self.name, self.start_time, self.duration)
         print('=======================')
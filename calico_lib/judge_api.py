@@ -1,30 +1,242 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from dataclasses import dataclass
 import json
+import logging
+import os
+import threading
+import time
+import uuid
 # from .problem import Problem
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 
+logger = logging.getLogger(__name__)
+
 BASE_URL = 'https://calicojudge.com/api/v4'
 
 USER = None
 
 CONTEST_ID = '-1'
 
+# (connect, read) timeouts in seconds. Uploads wait for the judge to import the zip.
+TIMEOUT = (10, 600)
+
+# Retries of idempotent requests on connection errors and 5xx responses
+MAX_RETRIES = 5
+BACKOFF_FACTOR = 0.5
+
+_SESSION: requests.Session|None = None
+_SESSION_LOCK = threading.Lock()
+
+# Snapshot of the problems of each contest: {contest id: {problem id: problem}},
+# fetched once with get_contest_problems and kept up to date by the write helpers
+_CONTEST_PROBLEMS: dict[str, dict[str, dict]] = {}
+_CONTEST_PROBLEMS_LOCK = threading.Lock()
+
+# Maximum number of requests in flight at once, across all threads
+MAX_CONCURRENCY = 4
+_REQUEST_SLOTS = threading.BoundedSemaphore(MAX_CONCURRENCY)
+
+def _get_session() -> requests.Session:
+    """The session shared by all requests, keeping connections alive between them."""
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            retry = Retry(
+                    total=MAX_RETRIES,
+                    backoff_factor=BACKOFF_FACTOR,
+                    status_forcelist=[429, 500, 502, 503, 504],
+                    allowed_methods=['HEAD', 'GET', 'PUT', 'DELETE', 'OPTIONS'],
+                    # return the last response, _request decides whether it's an error
+                    raise_on_status=False)
+            adapter = HTTPAdapter(
+                    pool_connections=4,
+                    pool_maxsize=max(16, MAX_CONCURRENCY),
+                    max_retries=retry)
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _SESSION = session
+        return _SESSION
+
+def set_timeout(connect: float, read: float):
+    """
+    Set the connect and read timeouts (seconds) of api requests.
+    """
+    global TIMEOUT
+    TIMEOUT = (connect, read)
+
+def set_retries(max_retries: int, backoff_factor: float = 0.5):
+    """
+    Set how many times idempotent requests (GET, PUT, DELETE) are retried, waiting
+    backoff_factor * 2^(retry - 1) seconds between retries.
+    """
+    global MAX_RETRIES, BACKOFF_FACTOR, _SESSION
+    MAX_RETRIES = max_retries
+    BACKOFF_FACTOR = backoff_factor
+    with _SESSION_LOCK:
+        _SESSION = None
+
+def set_max_concurrency(max_concurrency: int):
+    """
+    Set the maximum number of requests sent at once, by all threads.
+    """
+    global MAX_CONCURRENCY, _REQUEST_SLOTS, _SESSION
+    MAX_CONCURRENCY = max_concurrency
+    _REQUEST_SLOTS = threading.BoundedSemaphore(max_concurrency)
+    with _SESSION_LOCK:
+        _SESSION = None
+
+class _MultipartStream:
+    """
+    multipart/form-data body read from the files as it's sent, instead of loaded in
+    memory. fields: {name: value}, files: {name: (file name, path)}.
+    """
+    def __init__(self, fields: dict[str, str], files: dict[str, tuple[str, str]]):
+        boundary = uuid.uuid4().hex
+        self.content_type = f'multipart/form-data; boundary={boundary}'
+        # parts are either bytes or the path of a file
+        self._parts: list[bytes|str] = []
+        for name, value in fields.items():
+            self._parts.append(
+                    f'--{boundary}\r\n'
+                    f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+                    f'{value}\r\n'.encode())
+        for name, (file_name, path) in files.items():
+            self._parts.append(
+                    f'--{boundary}\r\n'
+                    f'Content-Disposition: form-data; name="{name}"; filename="{file_name}"\r\n'
+                    f'Content-Type: application/octet-stream\r\n\r\n'.encode())
+            self._parts.append(path)
+            self._parts.append(b'\r\n')
+        self._parts.append(f'--{boundary}--\r\n'.encode())
+        self.len = sum(len(part) if isinstance(part, bytes) else os.path.getsize(part)
+                       for part in self._parts)
+        self._index = 0
+        self._file = None
+
+    def read(self, size: int = -1) -> bytes:
+        out = b''
+        while self._index < len(self._parts) and (size < 0 or len(out) < size):
+            part = self._parts[self._index]
+            if isinstance(part, bytes):
+                out += part
+                self._index += 1
+                continue
+            if self._file is None:
+                self._file = open(part, 'rb')
+            chunk = self._file.read(-1 if size < 0 else size - len(out))
+            if not chunk:
+                self._file.close()
+                self._file = None
+                self._index += 1
+            out += chunk
+        return out
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+@dataclass
+class EndpointMetrics:
+    """Totals of all requests to one endpoint (method and route)."""
+    requests: int = 0
+    errors: int = 0
+    retries: int = 0
+    # seconds
+    total_time: float = 0.0
+    max_time: float = 0.0
+    bytes_sent: int = 0
+    bytes_received: int = 0
+
+_METRICS: dict[tuple[str, str], EndpointMetrics] = {}
+_METRICS_LOCK = threading.Lock()
+
+def _route(endpoint: str) -> str:
+    """The endpoint with contest and problem ids replaced by placeholders."""
+    parts = endpoint.split('/')
+    for i in range(1, len(parts)):
+        if parts[i - 1] == 'contests':
+            parts[i] = '{cid}'
+        elif parts[i - 1] == 'problems' and parts[i] != 'add-data':
+            parts[i] = '{pid}'
+    return '/'.join(parts)
+
+def _record(method: str, endpoint: str, elapsed: float, r: requests.Response|None):
+    with _METRICS_LOCK:
+        m = _METRICS.setdefault((method.upper(), _route(endpoint)), EndpointMetrics())
+        m.requests += 1
+        m.total_time += elapsed
+        m.max_time = max(m.max_time, elapsed)
+        if r is None or r.status_code >= 300:
+            m.errors += 1
+        if r is None:
+            return
+        m.bytes_sent += int(r.request.headers.get('Content-Length') or 0)
+        m.bytes_received += len(r.content)
+        retries = getattr(r.raw, 'retries', None)
+        if retries is not None:
+            m.retries += len(retries.history)
+
+def get_metrics() -> dict[tuple[str, str], EndpointMetrics]:
+    """Metrics of all requests so far, by (method, route)."""
+    with _METRICS_LOCK:
+        return dict(_METRICS)
+
+def reset_metrics():
+    with _METRICS_LOCK:
+        _METRICS.clear()
+
+def print_metrics_summary():
+    """Print a table of the requests made so far, slowest endpoints first."""
+    metrics = sorted(get_metrics().items(), key=lambda item: -item[1].total_time)
+    if not metrics:
+        return
+    header = f'{"endpoint":<45} {"reqs":>5} {"errs":>5} {"retry":>5} {"total s":>8} {"avg s":>7} {"max s":>7} {"sent":>9} {"recv":>9}'
+    print(header)
+    print('-' * len(header))
+    for (method, route), m in metrics:
+        print(f'{method + " " + route:<45} {m.requests:>5} {m.errors:>5} {m.retries:>5} '
+              f'{m.total_time:>8.2f} {m.total_time / m.requests:>7.2f} {m.max_time:>7.2f} '
+              f'{_format_bytes(m.bytes_sent):>9} {_format_bytes(m.bytes_received):>9}')
+
+def _format_bytes(n: int) -> str:
+    for unit in ['B', 'KB', 'MB']:
+        if n < 1000:
+            return f'{n:.0f}{unit}' if unit == 'B' else f'{n:.1f}{unit}'
+        n /= 1000
+    return f'{n:.1f}GB'
+
 def _request(method: str,
              endpoint: str,
              data=None,
              files=None,
-             require_200=True):
-    print("Request: " + method + " " + endpoint)
-    r = requests.request(method, BASE_URL + endpoint,
-                      data=data,
-                      files=files,
-                      auth=USER)
-    print(f'STATUS: {r.status_code}')
-    print(f'{r.text[:200]}')
+             require_200=True,
+             headers=None):
+    logger.info('Request: %s %s', method, endpoint)
+    start = time.perf_counter()
+    with _REQUEST_SLOTS:
+        try:
+            r = _get_session().request(method, BASE_URL + endpoint,
+                              data=data,
+                              files=files,
+                              headers=headers,
+                              auth=USER,
+                              timeout=TIMEOUT)
+        except requests.RequestException:
+            _record(method, endpoint, time.perf_counter() - start, None)
+            raise
+    elapsed = time.perf_counter() - start
+    _record(method, endpoint, elapsed, r)
+    logger.info('STATUS: %d (%.2fs) %s %s', r.status_code, elapsed, method, endpoint)
     if require_200 and r.status_code >= 300:
+        logger.warning('%s %s failed with %d: %s', method, endpoint, r.status_code, r.text[:200])
         raise Exception(r.status_code)
-    print(json.dumps(r.json(), indent=2))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug('%s', r.text[:2000])
     return r
 
 def set_user(user_password_pair: tuple[str, str]):
@@ -41,23 +253,30 @@ def set_contest_id(contest_id: str):
 def upload_problem_zip(file_name, pid: str|None) -> str:
     data = None
     if pid is None:
-        print('Creating problem...')
+        logger.info('Creating problem...')
     else:
-        print(f'Replacing problem; pid: {pid}...')
+        logger.info('Replacing problem; pid: %s...', pid)
         data = {'problem': str(pid), 'color': '#ffffff'}
-    r = _request('post',
-                 f'/contests/{CONTEST_ID}/problems',
-                 data=data,
-                 files={'zip': open(file_name, 'rb')})
+    body = _MultipartStream(data or {}, {'zip': (os.path.basename(file_name), file_name)})
+    try:
+        r = _request('post',
+                     f'/contests/{CONTEST_ID}/problems',
+                     data=body,
+                     headers={'Content-Type': body.content_type})
+    finally:
+        body.close()
 
-    print(f"problem uploaded with pid: {pid}")
+    logger.info('problem uploaded with pid: %s', pid)
     pid = r.json()['problem_id']
     assert pid is not None
+    # uploading to the contest also adds the problem to it
+    _update_snapshot(pid, {'id': pid})
     return pid
 
 def unlink_problem_from_contest(pid: str):
     _ = _request('DELETE', f'/contests/{CONTEST_ID}/problems/{pid}')
-    print('Unlinking problem...')
+    _update_snapshot(pid, None)
+    logger.info('Unlinking problem...')
 
 def link_problem_to_contest(pid: str, label: str, rgb: str):
     # TODO: support points
@@ -75,12 +294,13 @@ def link_problem_to_contest(pid: str, label: str, rgb: str):
             'rgb': rgb,
             }
     # data = json.dumps(data)
-    print(f'Linking problem... {pid}')
+    logger.info('Linking problem... %s', pid)
     _ = _request(
             'PUT',
             f'/contests/{CONTEST_ID}/problems/{pid}',
             data = data)
             # files={'data': ('problems.json', data)})
+    _update_snapshot(pid, {'id': pid, 'label': label, 'rgb': rgb})
     return
 
 def get_problem(pid: str):
@@ -94,6 +314,39 @@ def get_problem(pid: str):
         raise Exception(r.status_code)
     return r.json()
 
+def get_contest_problems(refresh: bool = False) -> dict[str, dict]:
+    """
+    All problems of the contest by id, fetched with a single request the first time
+    and cached for the run. Writes through this module keep the cache up to date,
+    use refresh (or invalidate_contest_problems) if the contest changed elsewhere.
+    """
+    with _CONTEST_PROBLEMS_LOCK:
+        if refresh or CONTEST_ID not in _CONTEST_PROBLEMS:
+            r = _request('get', f'/contests/{CONTEST_ID}/problems')
+            _CONTEST_PROBLEMS[CONTEST_ID] = {p['id']: p for p in r.json()}
+        return _CONTEST_PROBLEMS[CONTEST_ID]
+
+def invalidate_contest_problems():
+    """Drop the cached problems of all contests, they are fetched again when needed."""
+    with _CONTEST_PROBLEMS_LOCK:
+        _CONTEST_PROBLEMS.clear()
+
+def find_problem(pid: str) -> dict|None:
+    """Like get_problem, but looks up the cached snapshot of the contest problems."""
+    return get_contest_problems().get(pid)
+
+def _update_snapshot(pid: str, problem: dict|None):
+    """Record a write to problem pid of the current contest in the snapshot, if any.
+    None removes the problem."""
+    with _CONTEST_PROBLEMS_LOCK:
+        problems = _CONTEST_PROBLEMS.get(CONTEST_ID)
+        if problems is None:
+            return
+        if problem is None:
+            problems.pop(pid, None)
+        else:
+            problems[pid] = dict(problems.get(pid, {}), **problem)
+
 
 def add_problem_metadata_to_contest(name: str, label: str, rgb: str):
     """Adds the problem metadata, but not the zip"""
@@ -101,21 +354,28 @@ def add_problem_metadata_to_contest(name: str, label: str, rgb: str):
     #     _request('delete', f'/contests/{CONTEST_ID}/problems/{pid}')
     # except Exception as e:
     #     print("delete failed: " + str(e))
+    return add_problems_metadata_to_contest([(name, label, rgb)])[0]
+
+def add_problems_metadata_to_contest(problems: list[tuple[str, str, str]]):
+    """Adds the metadata (id, label, rgb) of all problems with a single request, but
+    not the zips"""
     data = [{
             'id': name,
             'label': label,
             'rgb': rgb,
-            }]
+            } for name, label, rgb in problems]
     data = json.dumps(data)
-    print(f'Adding problem metadata {data}')
+    logger.info('Adding problem metadata %s', data)
     r = _request(
             'post',
             f'/contests/{CONTEST_ID}/problems/add-data',
             # data = {'problem': str(pid)},
             files={'data': ('problems.json', data)})
     r = r.json()
-    assert len(r) == 1
-    return r[0]
+    assert len(r) == len(problems)
+    for name, label, rgb in problems:
+        _update_snapshot(name, {'id': name, 'label': label, 'rgb': rgb})
+    return r
 
 def create_contest(cid: str, name: str, start_time: datetime = datetime(2000, 1, 1, 0, 0), duration: str = '9999999:00:00'):
     """
@@ -141,7 +401,7 @@ def create_contest(cid: str, name: str, start_time: datetime = datetime(2000, 1,
             }
 
     data = json.dumps(data)
-    print(f'Creating contest {data}')
+    logger.info('Creating contest %s', data)
     _ = _request(
             'post',
             '/contests',
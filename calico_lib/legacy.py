@@ -21,14 +21,15 @@ def get_path(is_secret, file_name='', ext=None):
     ])
     return os.path.join(os.path.dirname(__file__), relative_path)
 
-def delete_old_zips(problem_name, test_set_names):
+def delete_old_zips(problem_name, test_set_names, base_dir='.'):
     """
-    Delete old zips if they exist so we can start making with a clean slate.
+    Delete old zips in base_dir if they exist so we can start making with a clean
+    slate.
     """
     print('Deleting old zips', end='...')
     deleted = False
     for test_set_name in test_set_names:
-        zip_file_name = get_zip_file_path(problem_name, test_set_name)
+        zip_file_name = os.path.join(base_dir, get_zip_file_path(problem_name, test_set_name))
         if os.path.exists(zip_file_name):
             os.remove(zip_file_name)
             deleted = True
@@ -36,18 +37,18 @@ def delete_old_zips(problem_name, test_set_names):
 
 
 def make_actual_zips(problem_name, time_limit, test_set_names, \
-                     is_data_in_test_set, is_submission_in_test_set):
+                     is_data_in_test_set, is_submission_in_test_set, base_dir='.'):
     """
-    Create a zip for each test set. Each test set consists of data, submissions,
-    and the DOMjudge metadata file.
+    Create a zip for each test set in base_dir, the problem directory. Each test set
+    consists of data, submissions, and the DOMjudge metadata file.
     """
     for test_set_name in test_set_names:
         print(f'Creating zip for test set "{test_set_name}"...')
 
-        file_path = get_zip_file_path(problem_name, test_set_name)
+        file_path = os.path.join(base_dir, get_zip_file_path(problem_name, test_set_name))
         with zipfile.ZipFile(file_path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            zip_path(zip_file, 'data', test_set_name, is_data_in_test_set)
-            zip_path(zip_file, 'submissions', test_set_name, is_submission_in_test_set)
+            zip_path(zip_file, 'data', test_set_name, is_data_in_test_set, base_dir)
+            zip_path(zip_file, 'submissions', test_set_name, is_submission_in_test_set, base_dir)
             zip_metadata(zip_file, problem_name, test_set_name, time_limit)
 
         print(f'Done creating zip for test set "{test_set_name}"!')
@@ -61,45 +62,52 @@ def get_zip_file_path(problem_name, test_set_name):
     return f'{problem_name}_{test_set_name}.zip'
 
 
-def zip_path(zip_file, path, test_set_name, is_file_in_test_set):
+def zip_path(zip_file, path, test_set_name, is_file_in_test_set, base_dir='.'):
     """
-    Add all files in path. Only files that is_file_in_test_set says
-    are to be added to the current test_set_name will be added.
+    Add all files in path, relative to base_dir. Only files that is_file_in_test_set
+    says are to be added to the current test_set_name will be added.
     """
     print(f'Zipping directory "{path}" for test set "{test_set_name}"', end='...')
 
     # path = os.path.join(os.path.dirname(__file__), relative_path)
-    for root, dirs, files in os.walk(path):
+    full_path = os.path.join(base_dir, path)
+    for root, dirs, files in os.walk(full_path):
         for file in files:
             if is_file_in_test_set(file, test_set_name):
                 file_path = os.path.join(root, file)
-                zip_path = os.path.relpath(os.path.join(root, file), os.path.join(path, '..'))
+                zip_path = os.path.relpath(file_path, os.path.join(full_path, '..'))
                 zip_file.write(file_path, zip_path)
 
     print('Done!')
 
 
+def metadata_ini(problem_name,
+                 test_set_name,
+                 time_limit,
+                 custom_compare = None):
+    """
+    Contents of the DOMjudge metadata file for the test_set_name.
+    """
+    lines = [
+            f'name={problem_name}_{test_set_name}',
+            f'timelimit={time_limit}',
+            ]
+    if custom_compare is not None:
+        lines.append(f'special_compare=\'{custom_compare}\'')
+    return '\n'.join(lines) + '\n'
+
+
 def zip_metadata(zip_file,
                  problem_name,
                  test_set_name,
                  time_limit,
                  custom_compare = None):
     """
-    Add the DOMjudge metadata file to the zip_file with the test_set_name. This
-    function creates a temporary file, writes name and timelimit, adds it to
-    the zip, then deletes the temporary file.
+    Add the DOMjudge metadata file to the zip_file with the test_set_name.
     """
     print(f'Zipping domjudge-problem.ini for test set "{test_set_name}"', end='...')
 
-    meta_path = os.path.join(os.path.dirname(__file__), 'domjudge-problem.ini')
-    with open(meta_path, 'w', encoding='utf-8', newline='\n') as meta_file:
-        problem_name = problem_name
-        print(f'name={problem_name}_{test_set_name}', file=meta_file)
-        print(f'timelimit={time_limit}', file=meta_file)
-        if custom_compare is not None:
-            print(f'special_compare=\'{custom_compare}\'', file=meta_file)
-
-    zip_file.write(meta_path, 'domjudge-problem.ini')
-    os.remove(meta_path)
+    zip_file.writestr('domjudge-problem.ini',
+                      metadata_ini(problem_name, test_set_name, time_limit, custom_compare))
 
     print('Done!')
@@ -1,8 +1,19 @@
-from .problem import Problem, TestFileBase
+from .problem import _TEST_FILE_BUFFER, Problem, TestFileBase
 from abc import ABC, abstractmethod
+from array import array
 from collections.abc import Collection, Iterable
+import shutil
+import string
+import tempfile
+from typing import NamedTuple
 # from typing import override
 
+# array typecodes of the field types stored in arrays, other types are stored in lists
+# (bool too, since an array would give back 1 and 0 instead of True and False)
+_TYPECODES = {int: 'q', float: 'd'}
+# cases serialized at once by CaseTable.write
+_WRITE_CHUNK = 1 << 16
+
 class TestCaseBase(ABC):
     def __init__(self) -> None:
         pass
@@ -16,12 +27,126 @@ class TestCaseBase(ABC):
     def verify_case(self, test_sets):
         pass
 
+class _Constraint(NamedTuple):
+    name: str
+    lo: object
+    hi: object
+    subproblems: Collection[str]|None
+
+def _positional_format(fmt: str, names: list[str]) -> str:
+    """fmt with its named fields replaced by their index in names."""
+    parts = []
+    for literal, field, spec, conversion in string.Formatter().parse(fmt):
+        parts.append(literal.replace('{', '{{').replace('}', '}}'))
+        if field is None:
+            continue
+        assert field in names, f'Unknown field {field!r} in format {fmt!r}'
+        parts.append('{' + str(names.index(field))
+                     + ('!' + conversion if conversion else '')
+                     + (':' + spec if spec else '') + '}')
+    return ''.join(parts)
+
+class CaseTable:
+    """
+    Cases of a multicase test stored by column instead of one object per case. The
+    schema is a NamedTuple (or any annotated class) whose fields are the columns: int
+    and float fields are stored in typed arrays (8 bytes per value), anything else in
+    a list. Each case is written with line_formats, str.format strings using the
+    field names, e.g. for a case of E: str, D: int, M: int, Y: int:
+
+        CaseTable(TestCase, ['{E}', '{Y:04d} {M:02d} {D:02d}'])
+    """
+    def __init__(self, schema: type, line_formats: list[str]):
+        self.schema = schema
+        self.names = list(schema.__annotations__)
+        self.columns: dict[str, array|list] = {}
+        for name, field_type in schema.__annotations__.items():
+            typecode = _TYPECODES.get(field_type)
+            self.columns[name] = array(typecode) if typecode is not None else []
+        self._template = ''.join(_positional_format(line, self.names) + '\n' for line in line_formats)
+        self._constraints: list[_Constraint] = []
+
+    def __len__(self):
+        return len(self.columns[self.names[0]])
+
+    def append(self, *values, **fields):
+        """Add a case, with the fields in schema order or by name."""
+        case = self.schema(*values, **fields)
+        for name in self.names:
+            self.columns[name].append(getattr(case, name))
+
+    def extend(self, **columns: Iterable):
+        """Add many cases at once, given every column (e.g. lists or NumPy arrays)."""
+        assert set(columns) == set(self.names), f'Expected the columns {self.names}'
+        for name in self.names:
+            values = columns[name]
+            column = self.columns[name]
+            if isinstance(column, array) and hasattr(values, 'tolist'):
+                values = values.tolist()
+            column.extend(values)
+        lengths = {len(column) for column in self.columns.values()}
+        assert len(lengths) == 1, 'All columns must have the same length'
+
+    def column(self, name: str) -> array|list:
+        return self.columns[name]
+
+    def __getitem__(self, i: int):
+        return self.schema(*(self.columns[name][i] for name in self.names))
+
+    def __iter__(self):
+        return map(self.schema, *(self.columns[name] for name in self.names))
+
+    def require(self, name: str, lo, hi, subproblems: Collection[str]|None = None):
+        """Require lo <= value <= hi for every value of the column, or lo <= len(value)
+        <= hi for columns that aren't stored in arrays (e.g. strings), in the tests of
+        subproblems (by default all). Checked by verify."""
+        assert name in self.columns, f'Unknown column {name!r}'
+        self._constraints.append(_Constraint(name, lo, hi, subproblems))
+
+    def verify(self, subproblems: Collection[str]):
+        """Check the constraints of subproblems, a whole column at a time."""
+        if len(self) == 0:
+            return
+        for constraint in self._constraints:
+            if constraint.subproblems is not None and not set(constraint.subproblems) & set(subproblems):
+                continue
+            column = self.columns[constraint.name]
+            if isinstance(column, array):
+                what, values = constraint.name, column
+            else:
+                what, values = f'len({constraint.name})', list(map(len, column))
+            lo, hi = min(values), max(values)
+            assert constraint.lo <= lo and hi <= constraint.hi, \
+                    f'{what} must be in [{constraint.lo}, {constraint.hi}], got values in [{lo}, {hi}]'
+
+    def write(self, problem: Problem):
+        """Write every case to the current test file of problem, in chunks of cases
+        formatted with a single call each."""
+        columns = [self.columns[name] for name in self.names]
+        for start in range(0, len(self), _WRITE_CHUNK):
+            chunk = [column[start:start + _WRITE_CHUNK] for column in columns]
+            problem.print_test(''.join(map(self._template.format, *chunk)), end='')
+
 class MulticaseTestFile(TestFileBase):
     problem = None
 
-    def __init__(self, cases: Iterable[TestCaseBase]|None = None) -> None:
+    def __init__(self, cases: Iterable[TestCaseBase]|CaseTable|None = None, stream: bool = False) -> None:
+        """
+        cases may be a CaseTable, which is written in bulk.
+
+        If stream, cases (e.g. a generator) is only iterated once while writing the
+        test, without keeping the cases in memory: each case is checked with
+        verify_case and written as it's produced, and the number of cases is written
+        before them once they are all known.
+        """
+        assert not (stream and isinstance(cases, CaseTable)), "A CaseTable can't be streamed"
+        self.stream = stream
+        # number of cases written, known after write_test_in when streaming
+        self.case_count: int|None = None
         if cases is None:
-            self.cases: list[TestCaseBase] = []
+            self.cases: Iterable[TestCaseBase]|CaseTable = []
+        elif isinstance(cases, CaseTable) or stream:
+            self.cases = cases
         else:
             self.cases = list(cases)
         super().__init__()
@@ -31,11 +156,37 @@ class MulticaseTestFile(TestFileBase):
     #     return ['bonus']
 
     # @override
+    def _write_streamed(self):
+        assert self.problem is not None and self.problem._cur_file is not None
+        test_file = self.problem._cur_file
+        # The cases go to a temporary file first, then are copied after the count
+        with tempfile.TemporaryFile('w+', _TEST_FILE_BUFFER, encoding='utf-8', newline='\n') as body:
+            self.problem._cur_file = body
+            count = 0
+            try:
+                for case in self.cases:
+                    case.verify_case(self.subproblems)
+                    case.write_test_in()
+                    count += 1
+            finally:
+                self.problem._cur_file = test_file
+            self.case_count = count
+            self.problem.print_test(count)
+            body.seek(0)
+            shutil.copyfileobj(body, test_file, _TEST_FILE_BUFFER)
+
     def write_test_in(self):
         assert self.problem != None, "Must set problem for multicase test file"
+        if self.stream:
+            self._write_streamed()
+            return super().write_test_in()
+        self.case_count = len(self.cases)
         self.problem.print_test(len(self.cases))
-        for case in self.cases:
-            case.write_test_in()
+        if isinstance(self.cases, CaseTable):
+            self.cases.write(self.problem)
+        else:
+            for case in self.cases:
+                case.write_test_in()
         return super().write_test_in()
 
 #
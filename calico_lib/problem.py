@@ -1,19 +1,89 @@
 from abc import ABC, abstractmethod
-from collections.abc import Callable, Collection
+from collections.abc import Callable, Collection, Iterable
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import hashlib
+import inspect
+import json
+import math
+import multiprocessing
 import os
+import pickle
+import random
 import shutil
+import sys
+import threading
 from typing import Dict, NamedTuple
 # from warnings import deprecated
 import zipfile
 
-from .judge_api import add_problem_metadata_to_contest, get_problem, link_problem_to_contest, set_contest_id, set_user, unlink_problem_from_contest, upload_problem_zip
+from .judge_api import add_problem_metadata_to_contest, add_problems_metadata_to_contest, find_problem, get_problem, link_problem_to_contest, set_contest_id, set_user, unlink_problem_from_contest, upload_problem_zip
 import argparse
 from .legacy import *
+from .runner import _ALL_EXECUTABLES, ExecResult, Runner, working_dir
+from . import judge_api, verify, zipbuild
 import traceback
 import subprocess
 
-# TODO:
-# screw problem dir, just have user cd into dir
+# The problems whose generators are being run by worker pools, by id. Set before the
+# pool forks so that workers inherit it (test generators are closures and can't be pickled).
+_POOL_PROBLEMS: dict[int, 'Problem'] = {}
+
+def _run_test_generator(task: tuple[int, int]):
+    problem_id, index = task
+    problem = _POOL_PROBLEMS[problem_id]
+    with working_dir(problem.problem_dir):
+        return problem._all_test_generators[index].generate()
+
+# Generators and pre generation functions running in this process share the global
+# random state, so only one problem generates tests at a time.
+_GENERATION_LOCK = threading.Lock()
+
+_MANIFEST_NAME = '.calico-manifest.json'
+_ZIP_MANIFEST_NAME = '.calico-zips.json'
+_UPLOAD_LEDGER_NAME = '.calico-uploads.json'
+
+# Buffer size of test files. print_test is called many times with small strings.
+_TEST_FILE_BUFFER = 1 << 20
+
+def _format_seq(seq, sep: str) -> str:
+    # NumPy arrays (or anything else with tolist) are converted to python scalars in
+    # one call, which is much faster than iterating over the array.
+    if hasattr(seq, 'tolist'):
+        seq = seq.tolist()
+    return sep.join(map(str, seq))
+
+def _hash_source(obj) -> str|None:
+    """Hash of the source code of a function or class and of the whole file defining it,
+    so that changes to helpers it calls are detected. None if unavailable."""
+    try:
+        h = hashlib.sha256(inspect.getsource(obj).encode())
+        path = inspect.getsourcefile(obj)
+        if path is None:
+            return None
+        with open(path, 'rb') as f:
+            h.update(hashlib.file_digest(f, 'sha256').digest())
+        return h.hexdigest()
+    except (OSError, TypeError):
+        return None
+
+def _class_path(cls: type) -> str:
+    return f'{cls.__module__}:{cls.__qualname__}'
+
+def _resolve_class_path(path: str) -> type|None:
+    module_name, qualname = path.split(':')
+    obj = sys.modules.get(module_name)
+    for attr in qualname.split('.'):
+        obj = getattr(obj, attr, None)
+    return obj if isinstance(obj, type) else None
+
+class _TestGenerator(NamedTuple):
+    file_path: str
+    seed: str
+    # hash of the generator source and its file (or of the test itself if added in place),
+    # None if it can't be determined, in which case the test is always regenerated
+    identity: str|None
+    # writes the test files and returns its manifest entry (without the fingerprint)
+    generate: Callable[[], dict]
 
 class TestFileBase(ABC):
     # TODO: consider storing filename in this class
@@ -44,10 +114,46 @@ class TestFileBase(ABC):
 
 _DEFAULT_MEMLIMIT = 256_000_000
 
+class PackLimit(NamedTuple):
+    """Limits of a test of a subproblem, see Problem.add_packed_tests."""
+    max_cases: int
+    max_weight: float = math.inf
+
+def _pack(weights: list[float], max_cases: int, max_weight: float) -> list[list[int]]:
+    """
+    Pack items into bins of at most max_cases items of total weight at most
+    max_weight, first fit decreasing. Returns the indices of the items of each bin,
+    in increasing order.
+    """
+    for w in weights:
+        assert w <= max_weight, f'A case of weight {w} is over the weight limit {max_weight}'
+    size = 1
+    while size < len(weights):
+        size *= 2
+    # segment tree of the remaining weight of each bin (-1 once it has max_cases
+    # items), to find the first bin an item fits in
+    tree = [max_weight] * (2 * size)
+    bins: list[list[int]] = []
+    for i in sorted(range(len(weights)), key=lambda i: -weights[i]):
+        w = weights[i]
+        node = 1
+        while node < size:
+            node = 2 * node if tree[2 * node] >= w else 2 * node + 1
+        b = node - size
+        if b == len(bins):
+            bins.append([])
+        bins[b].append(i)
+        tree[node] = tree[node] - w if len(bins[b]) < max_cases else -1
+        node //= 2
+        while node:
+            tree[node] = max(tree[2 * node], tree[2 * node + 1])
+            node //= 2
+    return [sorted(indices) for indices in bins]
+
 class Subproblem(NamedTuple):
     name: str
     rank: int
-    time_limit: int = 1
+    time_limit: float = 1
     mem_limit: int = _DEFAULT_MEMLIMIT
     def color(self):
         rank_color_map = {
@@ -68,7 +174,8 @@ class Problem:
     def __init__(self, problem_name: str, problem_dir: str, test_sets: list[Subproblem] = []):
         self.problem_name = problem_name
         self.test_sets = test_sets
-        self.problem_dir = problem_dir
+        # absolute, so that nothing depends on the working directory of the process
+        self.problem_dir = os.path.abspath(problem_dir)
         self.custom_checker = None
 
         # order of the problem in the contest. Used for label. Otherwise, label is problem_name
@@ -87,9 +194,18 @@ class Problem:
 
         # the current file that we will write to with print_test
         self._cur_file = None
+        # the input of the test whose answer is being written
+        self._cur_infile: str|None = None
+        # the most expensive run of write_answer_from for the current test
+        self._cur_answer_usage: ExecResult|None = None
+        # limits applied when running solutions with write_answer_from
+        self.answer_time_limit: float|None = None
+        self.answer_mem_limit: int|None = None
         self._sample_path = os.path.join('data', 'sample')
         self._secret_path = os.path.join('data', 'secret')
-        self._all_test_generators = []
+        self._all_test_generators: list[_TestGenerator] = []
+        # validators run on the generated inputs, with the subproblems they apply to
+        self._input_validators: list[tuple[Runner, list[str]|None]] = []
 
 
     def init_problem(self):
@@ -114,7 +230,34 @@ class Problem:
             ):
         """Print data to the test file. Arguments are the same as print."""
         assert self._cur_file != None, "This function should be called in one of the test_write_* function"
-        print(*values, sep=sep, end=end, file=self._cur_file)
+        if sep is None: sep = ' '
+        if end is None: end = '\n'
+        self._cur_file.write(sep.join(map(str, values)) + end)
+
+    def print_test_array(self, seq, sep: str = ' ', end: str = '\n'):
+        """Print all values of seq (e.g. a list or NumPy array) on one line."""
+        assert self._cur_file is not None, "This function should be called in one of the test_write_* function"
+        self._cur_file.write(_format_seq(seq, sep) + end)
+
+    def print_test_matrix(self, rows, sep: str = ' ', end: str = '\n'):
+        """Print each row of rows (e.g. a list of lists or 2D NumPy array) on its own line."""
+        assert self._cur_file is not None, "This function should be called in one of the test_write_* function"
+        if hasattr(rows, 'tolist'):
+            rows = rows.tolist()
+        self._cur_file.write(''.join(_format_seq(row, sep) + end for row in rows))
+
+    def write_answer_from(self, runner: Runner, infile: str|None = None):
+        """Write the output of runner on infile (by default the input of the current
+        test) to the test file, streaming it without holding it in memory. The run is
+        limited by answer_time_limit and answer_mem_limit, and its resource usage is
+        recorded in the manifest (see usage_report)."""
+        assert self._cur_file is not None, "This function should be called in one of the test_write_* function"
+        if infile is None:
+            infile = self._cur_infile
+        assert infile is not None
+        result = runner.exec_to_file(infile, self._cur_file, self.answer_time_limit, self.answer_mem_limit)
+        if self._cur_answer_usage is None or result.cpu_time > self._cur_answer_usage.cpu_time:
+            self._cur_answer_usage = result
 
     def _add_test(self,
                   test_file_or_fn: TestFileBase|Callable[[], TestFileBase],
@@ -124,32 +267,52 @@ class Problem:
         if subproblems is None:
             subproblems = [s.name for s in self.test_sets]
         file_path = os.path.join(file_dir, file_prefix + '_' + subproblems[0])
+        # Each test gets its own seed so the output doesn't depend on the order
+        # (or process) in which generators run.
+        seed = f'{self.problem_name}/{os.path.basename(file_dir)}/{file_prefix}_{subproblems[0]}'
         def test_generator():
+            random.seed(seed)
             if callable(test_file_or_fn):
                 test = test_file_or_fn()
             else:
                 test = test_file_or_fn
             test.subproblems = subproblems
-            with open(file_path + '.in', 'w', encoding='utf-8', newline='\n') as in_file:
+            abs_path = os.path.join(self.problem_dir, file_path)
+            with open(abs_path + '.in', 'w', _TEST_FILE_BUFFER, encoding='utf-8', newline='\n') as in_file:
                 self._cur_file = in_file
                 print(f"Writing infile {file_path+'.in'}")
                 test.write_test_in()
             self._cur_file = None
 
             # try:
-            test.validate_test_in(file_path + '.in')
+            test.validate_test_in(abs_path + '.in')
             # except (AssertionError, subprocess.CalledProcessError):
             #     print(f"!!--------------------------------------------")
             #     print(f"Validation failed on testcase {file_name}")
             #     print(traceback.format_exc())
             #     # pass
-            with open(file_path + '.ans', 'w', encoding='utf-8', newline='\n') as out_file:
+            with open(abs_path + '.ans', 'w', _TEST_FILE_BUFFER, encoding='utf-8', newline='\n') as out_file:
                 self._cur_file = out_file
+                self._cur_infile = abs_path + '.in'
                 print(f"Writing ans (out) file {file_path+'.ans'}")
-                test.write_test_out(file_path + '.in')
+                test.write_test_out(abs_path + '.in')
             self._cur_file = None
-
-        self._all_test_generators.append(test_generator)
+            self._cur_infile = None
+            usage = self._cur_answer_usage
+            self._cur_answer_usage = None
+            return {
+                    'test_class': _class_path(type(test)),
+                    'answer_usage': usage.to_dict() if usage is not None else None,
+                    }
+
+        if callable(test_file_or_fn):
+            identity = _hash_source(test_file_or_fn)
+        else:
+            try:
+                identity = hashlib.sha256(pickle.dumps(test_file_or_fn)).hexdigest()
+            except (pickle.PicklingError, TypeError, AttributeError):
+                identity = None
+        self._all_test_generators.append(_TestGenerator(file_path, seed, identity, test_generator))
         for subproblem in subproblems:
             self.test_paths[subproblem].append(file_path)
 
@@ -167,10 +330,52 @@ class Problem:
     def add_hidden_test(self, test_or_fn: TestFileBase|Callable[[], TestFileBase], name: str='', subproblems: list[str]|None = None):
         if isinstance(test_or_fn, TestFileBase):
             print(f'[Warning]: {self.problem_name} hidden test added in place...')
+        self._add_hidden_test(test_or_fn, name, subproblems)
+
+    def _add_hidden_test(self, test_or_fn: TestFileBase|Callable[[], TestFileBase], name: str, subproblems: list[str]|None):
         if name != '': name = '_' + name
         self._add_test(test_or_fn, self._secret_path, f'{self.hidden_count:02d}{name}', subproblems)
         self.hidden_count += 1
 
+    def add_packed_tests(self,
+                         cases: Iterable|Callable[[], Iterable],
+                         make_test: Callable[[list], TestFileBase],
+                         limits: PackLimit|dict[str, PackLimit],
+                         weight: Callable[[object], float]|None = None,
+                         name: str = 'packed',
+                         subproblems: list[str]|None = None) -> int:
+        """
+        Pack cases into as few hidden tests of subproblems (by default all) as
+        possible, and add each test made by make_test(cases of the test). A test
+        has at most max_cases cases, of total weight (weight(case), e.g. the N of
+        the case) at most max_weight, for the limits of every subproblem it belongs
+        to. limits is either the same for all subproblems, or a dict by subproblem.
+
+        If cases is a function, it's called after seeding random, so the cases
+        are the same on every run. Returns the number of tests added.
+        """
+        if subproblems is None:
+            subproblems = [s.name for s in self.test_sets]
+        if isinstance(limits, PackLimit):
+            limits = {subproblem: limits for subproblem in subproblems}
+        max_cases = min(limits[subproblem].max_cases for subproblem in subproblems)
+        max_weight = min(limits[subproblem].max_weight for subproblem in subproblems)
+        if callable(cases):
+            random.seed(f'{self.problem_name}/packed/{name}')
+            cases = cases()
+        cases = list(cases)
+        weights = [weight(case) if weight is not None else 1 for case in cases]
+
+        bins = _pack(weights, max_cases, max_weight)
+        lower_bound = max(math.ceil(len(cases) / max_cases),
+                          math.ceil(sum(weights) / max_weight) if max_weight != math.inf else 0)
+        print(f'{self.problem_name}: packed {len(cases)} cases into {len(bins)} tests '
+              f'(at least {lower_bound} needed)')
+        for indices in bins:
+            # added in place, the cases are already fixed
+            self._add_hidden_test(make_test([cases[i] for i in indices]), name, subproblems)
+        return len(bins)
+
     def hidden_test_generator(self, test_count = 1, subproblems: list[str] = ['main']):
         """A function decorator that adds a hidden test generator. Repeats to generate
         test_count number of test files.
@@ -189,51 +394,318 @@ class Problem:
         self._test_validator = validator
         return validator
 
-    def create_all_tests(self):
-        """Delete existing tests and regenerate them based on all the tests and generators added."""
-        os.chdir(self.problem_dir)
+    def add_input_validator(self, runner: Runner, subproblems: list[str]|None = None):
+        """
+        Validate the inputs of the tests of subproblems (by default all) with runner,
+        which must exit with 0 on valid inputs. create_all_tests validates every
+        generated input at the end, starting the validator once per worker instead
+        of once per test (see Runner.validate_files).
+        """
+        self._input_validators.append((runner, subproblems))
+
+    def _validate_inputs(self, gens: list[_TestGenerator], workers: int = 1) -> set[str]:
+        """Run the input validators on the tests of gens, split between workers
+        processes. Returns the paths of the tests that failed."""
+        failed = set()
+        for runner, subproblems in self._input_validators:
+            if subproblems is None:
+                subproblems = [s.name for s in self.test_sets]
+            included = {path for subproblem in subproblems for path in self.test_paths[subproblem]}
+            paths = [gen.file_path + '.in' for gen in gens if gen.file_path in included]
+            if not paths:
+                continue
+            chunks = [paths[i::workers] for i in range(min(workers, len(paths)))]
+            def validate(chunk: list[str]):
+                with working_dir(self.problem_dir):
+                    return runner.validate_files(chunk)
+            print(f'Validating {len(paths)} inputs with {" ".join(runner.run_cmd)}...')
+            with ThreadPoolExecutor(len(chunks)) as pool:
+                results = [result for chunk in pool.map(validate, chunks) for result in chunk]
+            for result in results:
+                if not result.ok:
+                    print(f'Validation failed on {result.path}:\n{result.message}')
+                    failed.add(result.path.removesuffix('.in'))
+        return failed
+
+    def _manifest_path(self):
+        return os.path.join(self.problem_dir, 'data', _MANIFEST_NAME)
+
+    def _load_manifest(self) -> dict:
+        try:
+            with open(self._manifest_path(), encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_manifest(self, manifest: dict):
+        with open(self._manifest_path(), 'w', encoding='utf-8', newline='\n') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+
+    def _shared_fingerprint(self) -> str:
+        """Hash of everything that may affect every test: the pre generation function
+        and the runners (solutions, validators) with files in this problem's directory."""
+        h = hashlib.sha256()
+        h.update(str(_hash_source(self.pre_fn) if self.pre_fn is not None else None).encode())
+        with working_dir(self.problem_dir):
+            for runner in self.runners():
+                h.update(runner.fingerprint().encode())
+        return h.hexdigest()
+
+    def runners(self) -> list[Runner]:
+        """The registered runners with files in this problem's directory."""
+        problem_dir = os.path.realpath(self.problem_dir)
+        runners = []
+        with working_dir(self.problem_dir):
+            for runner in _ALL_EXECUTABLES:
+                paths = [os.path.realpath(path) for path in runner.files()]
+                if any(os.path.commonpath([problem_dir, path]) == problem_dir for path in paths):
+                    runners.append(runner)
+        return runners
+
+    def compile_runners(self, workers: int = 1):
+        """Compile the runners of this problem (see runners), with workers compilations
+        at once."""
+        def compile(runner: Runner):
+            with working_dir(self.problem_dir):
+                return runner.compile()
+        with ThreadPoolExecutor(workers) as pool:
+            list(pool.map(compile, self.runners()))
+
+    def _test_fingerprint(self, gen: _TestGenerator, class_path: str, shared: str) -> str|None:
+        if gen.identity is None:
+            return None
+        cls = _resolve_class_path(class_path)
+        if cls is None:
+            return None
+        parts = [gen.identity, gen.seed, shared, _hash_source(cls)]
+        return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+    def _is_up_to_date(self, gen: _TestGenerator, entry: dict|None, shared: str):
+        if entry is None:
+            return False
+        path = os.path.join(self.problem_dir, gen.file_path)
+        if not (os.path.exists(path + '.in') and os.path.exists(path + '.ans')):
+            return False
+        fingerprint = self._test_fingerprint(gen, entry['test_class'], shared)
+        return fingerprint is not None and fingerprint == entry['fingerprint']
+
+    def _remove_stale_tests(self):
+        """Remove generated files that no longer belong to any test."""
+        expected = set()
+        for gen in self._all_test_generators:
+            expected.add(os.path.normpath(gen.file_path + '.in'))
+            expected.add(os.path.normpath(gen.file_path + '.ans'))
+        for dir in (self._sample_path, self._secret_path):
+            for name in os.listdir(os.path.join(self.problem_dir, dir)):
+                path = os.path.normpath(os.path.join(dir, name))
+                abs_path = os.path.join(self.problem_dir, path)
+                if path not in expected and os.path.isfile(abs_path):
+                    print(f'Removing stale test file {path}')
+                    os.remove(abs_path)
+
+    def create_all_tests(self, workers: int = 1, clean: bool = False):
+        """Regenerate tests based on all the tests and generators added. Tests whose
+        generator, seed, test class, pre generation function and runners are unchanged
+        since the last run (as recorded in data/.calico-manifest.json) are kept as is.
+        If clean, delete all existing tests and regenerate everything.
+        If workers > 1, generators are run in parallel on that many forked processes,
+        so no other thread should be running at the time (forking while another thread
+        holds a lock can deadlock the workers).
+        Runners are run in the problem directory (see runner.working_dir)."""
+        sample_path = os.path.join(self.problem_dir, self._sample_path)
+        secret_path = os.path.join(self.problem_dir, self._secret_path)
+        if clean:
+            for path in (sample_path, secret_path, self._manifest_path()):
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                elif os.path.exists(path):
+                    os.remove(path)
+        os.makedirs(sample_path, exist_ok=True)
+        os.makedirs(secret_path, exist_ok=True)
+
+        shared = self._shared_fingerprint()
+        manifest = self._load_manifest()
+        pending = []
+        kept = {}
+        for i, gen in enumerate(self._all_test_generators):
+            entry = manifest.get(gen.file_path)
+            if self._is_up_to_date(gen, entry, shared):
+                kept[gen.file_path] = entry
+            else:
+                pending.append(i)
+        self._remove_stale_tests()
+        # Save before generating, so a failed run never leaves outdated entries behind
+        manifest = kept
+        self._save_manifest(manifest)
+        print(f'{len(kept)} tests up to date, generating {len(pending)} tests...')
+
+        with working_dir(self.problem_dir), _GENERATION_LOCK:
+            if self.pre_fn is not None:
+                print('\nRunning pre generation tasks...')
+                self.pre_fn()
+            if workers <= 1:
+                entries = [self._all_test_generators[i].generate() for i in pending]
+            else:
+                assert 'fork' in multiprocessing.get_all_start_methods(), \
+                        "Parallel test generation requires the fork start method"
+                _POOL_PROBLEMS[id(self)] = self
+                try:
+                    with ProcessPoolExecutor(workers, multiprocessing.get_context('fork')) as pool:
+                        entries = list(pool.map(_run_test_generator, [(id(self), i) for i in pending]))
+                finally:
+                    del _POOL_PROBLEMS[id(self)]
+
+        failed = self._validate_inputs([self._all_test_generators[i] for i in pending], workers)
+        for i, entry in zip(pending, entries):
+            gen = self._all_test_generators[i]
+            fingerprint = self._test_fingerprint(gen, entry['test_class'], shared)
+            # invalid tests are regenerated on the next run
+            if fingerprint is not None and gen.file_path not in failed:
+                manifest[gen.file_path] = dict(entry, fingerprint=fingerprint)
+        self._save_manifest(manifest)
+        assert not failed, f'{len(failed)} tests of {self.problem_name} failed validation'
+
+    def usage_report(self, fraction: float = 0.5) -> list[str]:
+        """
+        Print the tests where the solution used to write the answer (see
+        write_answer_from) used more than fraction of the time or memory limit of
+        any subproblem the test belongs to. Returns the flagged test paths.
+        """
+        manifest = self._load_manifest()
+        flagged = []
+        print(f'Tests using more than {fraction:.0%} of a subproblem limit:')
+        for test_set in self.test_sets:
+            for file_path in self.test_paths[test_set.name]:
+                usage = manifest.get(file_path, {}).get('answer_usage')
+                if usage is None:
+                    continue
+                time_frac = usage['cpu_time'] / test_set.time_limit
+                mem_frac = usage['peak_rss'] / test_set.mem_limit
+                if time_frac > fraction or mem_frac > fraction:
+                    print(f'  {file_path} ({test_set.name}): '
+                          f'{usage["cpu_time"]:.2f}s/{test_set.time_limit}s CPU, '
+                          f'{usage["peak_rss"] / 1e6:.1f}/{test_set.mem_limit / 1e6:.0f}MB')
+                    flagged.append(file_path)
+        if not flagged:
+            print('  None')
+        return flagged
+
+    def verify_submissions(self, workers: int = 1) -> bool:
+        """
+        Run all submissions in submissions/* against the tests of each test set, and
+        check that each gets the verdict of its folder under the time limit of the
+        test set. Prints a verdict matrix, returns whether all verdicts are as expected.
+        """
+        print(f'Verifying submissions of {self.problem_name}...')
+        return verify.verify_submissions(self, workers)
+
+    def calibrate_time_limits(self,
+                              workers: int = 1,
+                              runs: int = 3,
+                              multiplier: float = 2.0,
+                              margin: float = 0.0,
+                              apply: bool = False) -> dict[str, float]:
+        """
+        Recommend a time limit for each test set from the slowest median time of the
+        accepted submissions on the secret tests (see verify.calibrate_time_limits).
+        If apply, the recommended limits replace the time limits of the test sets,
+        and are used in the zips.
+        """
+        print(f'Calibrating time limits of {self.problem_name}...')
+        recommended = verify.calibrate_time_limits(self, workers, runs, multiplier, margin)
+        if apply:
+            self.test_sets = [test_set._replace(time_limit=recommended.get(test_set.name, test_set.time_limit))
+                              for test_set in self.test_sets]
+        return recommended
+
+    def _zip_manifest_path(self):
+        return os.path.join(self.problem_dir, 'data', _ZIP_MANIFEST_NAME)
 
+    def load_zip_manifest(self) -> dict:
+        """
+        The content manifest of each zip built by create_zip, keyed by zip file name:
+        {'inputs': {file name in zip: sha256 of its contents}, 'level': int,
+        'sha256': sha256 of the zip}.
+        """
         try:
-            shutil.rmtree(self._sample_path)
-            shutil.rmtree(self._secret_path)
-        except FileNotFoundError:
-            # First time running
-            pass
-        os.makedirs(self._sample_path, exist_ok=True)
-        os.makedirs(self._secret_path, exist_ok=True)
-
-        if self.pre_fn is not None:
-            print('\nRunning pre generation tasks...')
-            self.pre_fn()
-        for fn in self._all_test_generators:
-            fn()
-
-    def create_zip(self, name_prefix='draft_'):
+            with open(self._zip_manifest_path(), encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def create_zip(self, name_prefix='draft_', level: int = 6, workers: int = 1):
         """
         Create a zip for each test set. Each test set consists of data, submissions,
-        and the DOMjudge metadata file.
-        """
-        os.chdir(self.problem_dir)
+        and the DOMjudge metadata file. Every file is compressed once (at the given
+        zlib level) and reused by all zips that include it, and zips are built with
+        up to workers threads.
 
+        Zips are reproducible, and a zip is only rewritten if the contents of one of
+        its files changed since it was built (see load_zip_manifest).
+        """
         final_name = name_prefix + self.problem_name
 
+        # paths relative to the problem directory, the same as in the zips
+        submissions = [os.path.relpath(path, self.problem_dir) for path in
+                       zipbuild.list_files(os.path.join(self.problem_dir, 'submissions'))]
+        zip_files: dict[str, list[str]] = {}
         for test_set in self.test_sets:
+            files = []
+            for file in self.test_paths[test_set.name]:
+                files += [file + '.in', file + '.ans']
+            zip_files[test_set.name] = files + submissions
+        paths = list(dict.fromkeys(path for files in zip_files.values() for path in files))
+
+        with ThreadPoolExecutor(workers) as pool:
+            hashes = dict(zip(paths, pool.map(
+                lambda path: zipbuild.file_sha256(os.path.join(self.problem_dir, path)), paths)))
+
+        manifest = self.load_zip_manifest()
+        outdated: dict[str, dict] = {}
+        for test_set in self.test_sets:
+            zip_name = get_zip_file_path(final_name, test_set.name)
+            metadata = metadata_ini(final_name, test_set.name, test_set.time_limit, self.custom_checker)
+            inputs = {zipbuild.arcname_of(path): hashes[path] for path in zip_files[test_set.name]}
+            inputs['domjudge-problem.ini'] = hashlib.sha256(metadata.encode()).hexdigest()
+            entry = {'inputs': inputs, 'level': level}
+            old_entry = manifest.get(zip_name, {})
+            if (os.path.exists(os.path.join(self.problem_dir, zip_name))
+                    and old_entry.get('inputs') == inputs
+                    and old_entry.get('level') == level):
+                print(f'Zip for test set "{test_set.name}" is up to date, skipping')
+                continue
+            outdated[test_set.name] = entry
+
+        if not outdated:
+            return
+        # Only compress files of zips that need to be rebuilt
+        paths = list(dict.fromkeys(path for name in outdated for path in zip_files[name]))
+        print(f'Compressing {len(paths)} files...')
+        with ThreadPoolExecutor(workers) as pool:
+            compressed = dict(zip(paths, pool.map(
+                lambda path: zipbuild.compress_file(
+                    os.path.join(self.problem_dir, path), path, level), paths)))
+
+        def build_zip(test_set: Subproblem):
             file_path = get_zip_file_path(final_name, test_set.name)
             file_path = os.path.join(self.problem_dir, file_path)
             print(f'Creating zip for test set "{test_set.name}" at "{file_path}...')
-            with zipfile.ZipFile(file_path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                for file in self.test_paths[test_set.name]:
-                    zip_file.write(file+'.in')
-                    zip_file.write(file+'.ans')
-
-                zip_path(zip_file, 'submissions', test_set.name, lambda _, _2: True)
-                zip_metadata(zip_file,
-                             final_name,
-                             test_set.name,
-                             test_set.time_limit,
-                             self.custom_checker)
-
+            entries = [compressed[path] for path in zip_files[test_set.name]]
+            metadata = metadata_ini(final_name, test_set.name, test_set.time_limit, self.custom_checker)
+            entries.append(zipbuild.compress_bytes('domjudge-problem.ini', metadata.encode(), level))
+            zipbuild.write_zip(file_path, entries)
             print(f'Done creating zip for test set "{test_set.name}"!')
+            return zipbuild.file_sha256(file_path)
+
+        to_build = [test_set for test_set in self.test_sets if test_set.name in outdated]
+        with ThreadPoolExecutor(workers) as pool:
+            zip_hashes = list(pool.map(build_zip, to_build))
+
+        for test_set, zip_hash in zip(to_build, zip_hashes):
+            zip_name = get_zip_file_path(final_name, test_set.name)
+            manifest[zip_name] = dict(outdated[test_set.name], sha256=zip_hash)
+        with open(self._zip_manifest_path(), 'w', encoding='utf-8', newline='\n') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
 
     def add_final_metadata(self, p_num: int):
         """
@@ -241,59 +713,123 @@ class Problem:
         Upload metadata to contest.
         """
         print("adding metadata")
-        i = 0
-        for sub_test in self.test_sets:
+        metadata = []
+        for i, sub_test in enumerate(self.test_sets):
             subproblem = sub_test.name
 
             label = str(p_num)
             if i > 0:
                 label = label + f'b{i}'
-            add_problem_metadata_to_contest(
-                    self.problem_name + '_' + subproblem,
-                    label,
-                    sub_test.color(),
-                    )
-            i += 1
-
-    def upload(self):
-        i = 0
-        for test_set in self.test_sets:
+            metadata.append((self.problem_name + '_' + subproblem, label, sub_test.color()))
+        add_problems_metadata_to_contest(metadata)
+
+    def _label(self, i: int, pid: str) -> str:
+        """Label of the i-th test set: the ordinal, with b{i} for bonus test sets, or
+        the pid if the problem has no ordinal."""
+        if self.ordinal == -1:
+            return pid
+        label = str(self.ordinal)
+        if i > 0:
+            label = label + f'b{i}'
+        return label
+
+    def missing_metadata(self) -> list[tuple[str, str, str]]:
+        """(pid, label, rgb) of the test sets that don't exist on the judge yet."""
+        metadata = []
+        for i, test_set in enumerate(self.test_sets):
             pid = self.problem_name + '_' + test_set.name
-            label = pid
-            judge_problem = get_problem(pid)
-            if judge_problem is None:
-                print('problem not found... creating problem')
-                if self.ordinal != -1:
-                    label = str(self.ordinal)
-                    if i > 0:
-                        label = label + f'b{i}'
-                add_problem_metadata_to_contest(pid, label, test_set.color())
-            pid = upload_problem_zip(get_zip_file_path(self.problem_name, test_set.name), pid)
-            i = i + 1
-
-    def link_to_contest(self):
+            if find_problem(pid) is None:
+                metadata.append((pid, self._label(i, pid), test_set.color()))
+        return metadata
+
+    def _upload_ledger_path(self):
+        return os.path.join(self.problem_dir, 'data', _UPLOAD_LEDGER_NAME)
+
+    def load_upload_ledger(self) -> dict[str, dict[str, str]]:
+        """
+        The sha256 of the last zip uploaded for each test set:
+        {contest id: {problem id: sha256}}.
+        """
+        try:
+            with open(self._upload_ledger_path(), encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_upload_ledger(self, ledger: dict):
+        os.makedirs(os.path.dirname(self._upload_ledger_path()), exist_ok=True)
+        with open(self._upload_ledger_path(), 'w', encoding='utf-8', newline='\n') as f:
+            json.dump(ledger, f, indent=2, sort_keys=True)
+
+    def forget_uploads(self, pids: Collection[str]):
+        """Remove pids of the current contest from the upload ledger, e.g. because
+        they were (re)created on the judge without a zip."""
+        ledger = self.load_upload_ledger()
+        uploaded = ledger.get(judge_api.CONTEST_ID, {})
+        if any(pid in uploaded for pid in pids):
+            for pid in pids:
+                uploaded.pop(pid, None)
+            self._save_upload_ledger(ledger)
+
+    def upload(self, jobs: int = 1, force: bool = False):
+        """
+        Upload the zip of each test set, up to jobs test sets at once. Test sets
+        missing on the judge are created first, with a single request.
+
+        Zips identical to the last one uploaded to the contest (see
+        load_upload_ledger) are skipped, unless force.
+        """
+        missing = self.missing_metadata()
+        if missing:
+            print('problem not found... creating problem')
+            add_problems_metadata_to_contest(missing)
+            self.forget_uploads([pid for pid, _, _ in missing])
+
+        ledger = self.load_upload_ledger()
+        uploaded = ledger.setdefault(judge_api.CONTEST_ID, {})
+        # Reconcile with the judge: problems deleted there need their zip again
+        for pid in list(uploaded):
+            if find_problem(pid) is None:
+                del uploaded[pid]
+        ledger_lock = threading.Lock()
+
+        def upload_test_set(i: int, test_set: Subproblem):
+            pid = self.problem_name + '_' + test_set.name
+            zip_path = os.path.join(self.problem_dir, get_zip_file_path(self.problem_name, test_set.name))
+            zip_hash = zipbuild.file_sha256(zip_path)
+            if not force and uploaded.get(pid) == zip_hash:
+                print(f'Zip of {pid} is unchanged since the last upload, skipping')
+                return
+            upload_problem_zip(zip_path, pid)
+            with ledger_lock:
+                uploaded[pid] = zip_hash
+
+        try:
+            with ThreadPoolExecutor(jobs) as pool:
+                list(pool.map(upload_test_set, range(len(self.test_sets)), self.test_sets))
+        finally:
+            self._save_upload_ledger(ledger)
+
+    def link_to_contest(self, jobs: int = 1):
         """
         Link to contest, ordinal is used for tag (1 if this is the first problem, -1 to use pid as tag).
+        Up to jobs test sets are linked at once.
         """
-        i = 0
-        for test_set in self.test_sets:
+        def link_test_set(i: int, test_set: Subproblem):
             pid = self.problem_name + '_' + test_set.name
-            label = pid
             print("== Linking to Contest ==")
             # try:
             #     unlink_problem_from_contest(pid)
             # except Exception:
             #     pass
-            if self.ordinal != -1:
-                label = str(self.ordinal)
-                if i > 0:
-                    label = label + f'b{i}'
-            judge_problem = get_problem(pid)
+            judge_problem = find_problem(pid)
             if judge_problem is None:
-                link_problem_to_contest(pid, label, test_set.color())
+                link_problem_to_contest(pid, self._label(i, pid), test_set.color())
             else:
                 print('Warning: problem already linked, skipping...')
-            i = i + 1
+
+        with ThreadPoolExecutor(jobs) as pool:
+            list(pool.map(link_test_set, range(len(self.test_sets)), self.test_sets))
 
 
     # @deprecated("Use 'from calico_lib import run_cli' instead.")
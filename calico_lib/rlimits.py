@@ -0,0 +1,30 @@
+"""
+Resource limits of runs, shared by the runners and the fork server of warm_worker.
+Kept free of other imports, since the fork server's memory is counted in the peak RSS
+of every run it forks.
+"""
+import math
+import resource
+
+def _cpu_limits(time_limit: float) -> tuple[int, int]:
+    # the child is killed on the next second after the soft limit
+    cpu = math.ceil(time_limit)
+    return cpu, cpu + 1
+
+def set_limits(time_limit: float|None, mem_limit: int|None):
+    """Apply the limits to the current process: CPU seconds through RLIMIT_CPU and
+    bytes of address space through RLIMIT_AS."""
+    if time_limit is not None:
+        resource.setrlimit(resource.RLIMIT_CPU, _cpu_limits(time_limit))
+    if mem_limit is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (mem_limit, mem_limit))
+
+def prlimit_args(prlimit: str, time_limit: float|None, mem_limit: int|None) -> list[str]:
+    """Arguments to put before a command to run it with the limits through the
+    prlimit utility, the same as set_limits."""
+    args = [prlimit]
+    if time_limit is not None:
+        args.append('--cpu={}:{}'.format(*_cpu_limits(time_limit)))
+    if mem_limit is not None:
+        args.append(f'--as={mem_limit}:{mem_limit}')
+    return args + ['--']
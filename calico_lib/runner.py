@@ -1,33 +1,194 @@
 from collections.abc import Collection, Sequence
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+import hashlib
+import json
 import os
+import re
 import shutil
+import signal
+import socket
 import subprocess
 import sys
+import tempfile
+import threading
+import time
+from typing import NamedTuple
+
+from . import rlimits
 
 
 CC: str = 'g++'
+JAVA: str = 'java'
+# Used to apply resource limits to runs, see _limited_cmd
+PRLIMIT: str|None = shutil.which('prlimit')
+
+# Compiled binaries, keyed by the hash of the compile command, compiler version and sources
+COMPILE_CACHE_DIR: str|None = os.path.join(
+        os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')),
+        'calico_lib', 'compile')
+
+# Extensions of the sources whose included headers are part of the compile cache key
+_C_SOURCE_EXTENSIONS = ('.c', '.cc', '.cpp', '.cxx')
+
+_COMPILER_VERSIONS: dict[str, str] = {}
+_COMPILER_VERSIONS_LOCK = threading.Lock()
 
 _ALL_EXECUTABLES: list['Runner'] = []
 
+# Directory that runners started by the current thread run in (see working_dir)
+_WORKING_DIR = threading.local()
+
 def configure_cpp_cc(cmd):
     global CC
     CC = cmd
 
+def configure_compile_cache(cache_dir: str|None):
+    """Set the directory of the compile cache, None to disable caching."""
+    global COMPILE_CACHE_DIR
+    COMPILE_CACHE_DIR = cache_dir
+
+@contextmanager
+def working_dir(path: str|None):
+    """
+    Run the runners started by this thread in path, with relative paths in their
+    commands and arguments resolved against it, instead of the working directory of
+    the process. This lets threads work on problems in different directories.
+    """
+    old = getattr(_WORKING_DIR, 'path', None)
+    _WORKING_DIR.path = os.path.abspath(path) if path is not None else None
+    try:
+        yield
+    finally:
+        _WORKING_DIR.path = old
+
+def _cwd() -> str|None:
+    return getattr(_WORKING_DIR, 'path', None)
+
+def _resolve(path: str) -> str:
+    cwd = _cwd()
+    return os.path.join(cwd, path) if cwd is not None else path
+
+def _compiler_version(compiler: str) -> str:
+    with _COMPILER_VERSIONS_LOCK:
+        if compiler not in _COMPILER_VERSIONS:
+            try:
+                version = subprocess.check_output([compiler, '--version'], stderr=subprocess.STDOUT)
+                _COMPILER_VERSIONS[compiler] = version.decode(errors='replace')
+            except (subprocess.CalledProcessError, FileNotFoundError):
+                _COMPILER_VERSIONS[compiler] = ''
+        return _COMPILER_VERSIONS[compiler]
+
+@dataclass
+class ExecResult:
+    """Resources used by a single run of a Runner."""
+    returncode: int
+    # seconds
+    wall_time: float
+    # user + sys seconds
+    cpu_time: float
+    # bytes
+    peak_rss: int
+    timed_out: bool = False
+
+    @property
+    def ok(self):
+        return self.returncode == 0 and not self.timed_out
+
+    def to_dict(self):
+        return asdict(self)
+
+# characters of the end of stderr kept in a ValidationResult
+_MESSAGE_LIMIT = 2000
+
+class ValidationResult(NamedTuple):
+    """Result of a validator on one file, see Runner.validate_files."""
+    path: str
+    ok: bool
+    # end of the stderr of the validator
+    message: str
+
+def _limited_cmd(cmd: Sequence[str], time_limit: float|None, mem_limit: int|None):
+    """
+    The command and preexec_fn to run cmd with the given limits. Through the prlimit
+    utility if available: a preexec_fn runs in the forked child before exec, which can
+    deadlock while other threads run (see the subprocess docs), and runs are started
+    from many threads at once.
+    """
+    if time_limit is None and mem_limit is None:
+        return list(cmd), None
+    if PRLIMIT is not None:
+        return rlimits.prlimit_args(PRLIMIT, time_limit, mem_limit) + list(cmd), None
+    return list(cmd), lambda: rlimits.set_limits(time_limit, mem_limit)
+
+# seconds between two reads of the peak RSS of a running child
+_RSS_POLL_INTERVAL = 0.01
+
+def _read_vm_hwm(pid: int) -> int:
+    """Peak RSS in bytes of the running process pid since its last exec, 0 if unavailable."""
+    try:
+        with open(f'/proc/{pid}/status', 'rb') as f:
+            for line in f:
+                if line.startswith(b'VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return 0
+
+class _RssSampler(threading.Thread):
+    """Polls the peak RSS of a running child from /proc until stopped."""
+    def __init__(self, pid: int):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.peak = 0
+        self._done = threading.Event()
+
+    def run(self):
+        while True:
+            self.peak = max(self.peak, _read_vm_hwm(self.pid))
+            if self._done.wait(_RSS_POLL_INTERVAL):
+                return
+
+    def stop(self) -> int:
+        self._done.set()
+        self.join()
+        return self.peak
+
+def _child_peak_rss(maxrss: int, sampled: int) -> int:
+    """
+    The peak RSS in bytes of a child that was started with exec, given the ru_maxrss
+    of the child from wait4 and its peak RSS polled from /proc. On Linux, ru_maxrss
+    also counts the memory the child had before exec, a copy of this process, so it's
+    only the child's own peak when it's above the peak RSS of this process. Otherwise
+    the polled peak is used, which can miss a spike shortly before the child exits.
+    """
+    # ru_maxrss is in bytes on macOS, kilobytes elsewhere
+    if not sys.platform.startswith('linux'):
+        return maxrss if sys.platform == 'darwin' else maxrss * 1024
+    import resource
+    maxrss *= 1024
+    if maxrss > resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024:
+        return maxrss
+    return sampled
+
 # Runs various source files
 @dataclass
 class Runner:
     run_cmd: Sequence[str]
     compile_cmd: Sequence[str] | None = None
 
-    def __init__(self, run_cmd, compile_cmd):
+    def __init__(self, run_cmd, compile_cmd, register: bool = True):
+        """If register, the runner is compiled by compile_all and is part of the
+        fingerprint of generated tests."""
         self.run_cmd = run_cmd
         self.compile_cmd = compile_cmd
-        _ALL_EXECUTABLES.append(self)
+        if register:
+            _ALL_EXECUTABLES.append(self)
 
-    def exec(self):
+    def exec(self, timeout: float|None = None):
         try:
-            out = subprocess.check_output(self.run_cmd).decode()
+            out = subprocess.check_output(self.run_cmd, timeout=timeout, cwd=_cwd()).decode()
         except subprocess.CalledProcessError as e:
             print('Runner failed to run:')
             print(self)
@@ -35,10 +196,10 @@ class Runner:
             raise
         return out
 
-    def exec_file(self, infile: str):
-        with open(infile, encoding='utf-8', newline='\n') as file:
+    def exec_file(self, infile: str, timeout: float|None = None):
+        with open(_resolve(infile), encoding='utf-8', newline='\n') as file:
             try:
-                out = subprocess.check_output(self.run_cmd, stdin=file, encoding='utf-8')
+                out = subprocess.check_output(self.run_cmd, stdin=file, encoding='utf-8', timeout=timeout, cwd=_cwd())
             except subprocess.CalledProcessError as e:
                 print('Runner failed to run:')
                 print(self)
@@ -46,12 +207,316 @@ class Runner:
                 raise
             return out
 
+    def exec_to_file(self,
+                     infile: str,
+                     outfile,
+                     time_limit: float|None = None,
+                     mem_limit: int|None = None) -> ExecResult:
+        """Run with infile as stdin, with stdout connected directly to outfile (a path
+        or an open file), without reading the output into memory. Raises if the run
+        fails or exceeds the limits."""
+        result = self.exec_measured(infile, outfile, time_limit, mem_limit)
+        if not result.ok:
+            print('Runner failed to run:')
+            print(self)
+            print(result)
+            if result.timed_out:
+                raise subprocess.TimeoutExpired(self.run_cmd, result.wall_time)
+            raise subprocess.CalledProcessError(result.returncode, self.run_cmd)
+        return result
+
+    def exec_measured(self,
+                      infile: str|None = None,
+                      outfile = None,
+                      time_limit: float|None = None,
+                      mem_limit: int|None = None) -> ExecResult:
+        """
+        Run and measure wall time, CPU time and peak memory. infile is used as stdin,
+        stdout goes to outfile (a path or an open file), or is discarded if None.
+
+        If time_limit (seconds) is given, the run is stopped after that much CPU time
+        (through RLIMIT_CPU), or twice that much wall time. If mem_limit (bytes) is
+        given, the address space is limited through RLIMIT_AS.
+        """
+        with open(_resolve(infile) if infile is not None else os.devnull, 'rb') as stdin:
+            if isinstance(outfile, str):
+                with open(_resolve(outfile), 'wb') as stdout:
+                    return self._exec_measured(stdin, stdout, time_limit, mem_limit)
+            if outfile is not None:
+                # Anything already written through outfile's buffer goes first
+                outfile.flush()
+                return self._exec_measured(stdin, outfile, time_limit, mem_limit)
+            return self._exec_measured(stdin, subprocess.DEVNULL, time_limit, mem_limit)
+
+    def _exec_measured(self, stdin, stdout, time_limit, mem_limit) -> ExecResult:
+        cmd, preexec_fn = _limited_cmd(self.run_cmd, time_limit, mem_limit)
+        start = time.perf_counter()
+        proc = subprocess.Popen(cmd, stdin=stdin, stdout=stdout, preexec_fn=preexec_fn, cwd=_cwd())
+        sampler = None
+        if sys.platform.startswith('linux'):
+            sampler = _RssSampler(proc.pid)
+            sampler.start()
+
+        timed_out = threading.Event()
+        def kill():
+            timed_out.set()
+            proc.kill()
+        timer = None
+        if time_limit is not None:
+            timer = threading.Timer(2 * time_limit, kill)
+            timer.start()
+        sampled = 0
+        try:
+            if sampler is not None:
+                # stop polling before the child is reaped and its pid can be reused
+                os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOWAIT)
+                sampled = sampler.stop()
+            # wait4 instead of proc.wait to get the child's resource usage
+            _, status, usage = os.wait4(proc.pid, 0)
+        finally:
+            if timer is not None:
+                timer.cancel()
+            if sampler is not None:
+                sampler.stop()
+        wall_time = time.perf_counter() - start
+        proc.returncode = os.waitstatus_to_exitcode(status)
+
+        cpu_time = usage.ru_utime + usage.ru_stime
+        peak_rss = _child_peak_rss(usage.ru_maxrss, sampled)
+        exceeded_cpu = time_limit is not None and (
+                cpu_time > time_limit or proc.returncode == -signal.SIGXCPU)
+        return ExecResult(
+                proc.returncode,
+                wall_time,
+                cpu_time,
+                peak_rss,
+                timed_out.is_set() or exceeded_cpu)
+
+    def _python_source(self) -> str|None:
+        """The script run by the run command, if it's a python script."""
+        if len(self.run_cmd) == 2 and self.run_cmd[0] == sys.executable and self.run_cmd[1].endswith('.py'):
+            return self.run_cmd[1]
+        return None
+
+    def validate_files(self, paths: Sequence[str]) -> list[ValidationResult]:
+        """
+        Run as a validator on each file of paths: a file passes if the run with it as
+        stdin exits with 0. Python scripts are started once for all files (see
+        batch_validator), anything else is run once per file.
+        """
+        src_path = self._python_source()
+        if src_path is not None:
+            out = subprocess.run(
+                    [sys.executable, '-m', 'calico_lib.batch_validator', src_path],
+                    input=''.join(_resolve(path) + '\n' for path in paths),
+                    stdout=subprocess.PIPE, encoding='utf-8', check=True, cwd=_cwd()).stdout
+            replies = [json.loads(line) for line in out.splitlines()]
+            assert len(replies) == len(paths), f'Batch validation with {src_path} stopped early'
+            return [ValidationResult(path, reply['ok'], reply['message'])
+                    for path, reply in zip(paths, replies)]
+
+        results = []
+        for path in paths:
+            with open(_resolve(path), 'rb') as stdin:
+                proc = subprocess.run(self.run_cmd, stdin=stdin, stdout=subprocess.DEVNULL,
+                                      stderr=subprocess.PIPE, cwd=_cwd())
+            message = proc.stderr.decode(errors='replace').strip()[-_MESSAGE_LIMIT:]
+            results.append(ValidationResult(path, proc.returncode == 0, message))
+        return results
+
+    def files(self) -> list[str]:
+        """Existing files referenced by the run or compile command (sources, binaries)."""
+        args = list(self.run_cmd) + list(self.compile_cmd or [])
+        return [_resolve(arg) for arg in args if os.path.isfile(_resolve(arg))]
+
+    def fingerprint(self) -> str:
+        """Hash of the commands and the contents of every file they reference."""
+        h = hashlib.sha256()
+        for arg in list(self.run_cmd) + ['--'] + list(self.compile_cmd or []):
+            h.update(arg.encode() + b'\0')
+        for path in self.files():
+            with open(path, 'rb') as f:
+                h.update(hashlib.file_digest(f, 'sha256').digest())
+        return h.hexdigest()
+
+    def _compile_output(self) -> str|None:
+        """The binary written by the compile command (the argument after -o)."""
+        assert self.compile_cmd is not None
+        args = list(self.compile_cmd)
+        if '-o' not in args[:-1]:
+            return None
+        return args[args.index('-o') + 1]
+
+    def _header_dependencies(self) -> list[str]:
+        """
+        The headers included by the C/C++ sources of the compile command, except system
+        headers, as listed by the compiler with -MM. Empty for other languages or if
+        the compiler fails.
+        """
+        assert self.compile_cmd is not None
+        args = list(self.compile_cmd)
+        if not any(arg.endswith(_C_SOURCE_EXTENSIONS) for arg in args):
+            return []
+        if self._compile_output() is not None:
+            i = args.index('-o')
+            del args[i:i + 2]
+        try:
+            out = subprocess.run(args + ['-MM'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                 cwd=_cwd(), check=True).stdout.decode()
+        except (subprocess.CalledProcessError, OSError):
+            return []
+        # make rules "source.o: source.cpp header.h \", spaces in paths escaped
+        tokens = re.split(r'(?<!\\)\s+', out.replace('\\\n', ' '))
+        return [token.replace('\\ ', ' ') for token in tokens if token and not token.endswith(':')]
+
+    def _compile_key(self) -> str:
+        assert self.compile_cmd is not None
+        output = self._compile_output()
+        h = hashlib.sha256()
+        h.update(_compiler_version(self.compile_cmd[0]).encode())
+        for arg in self.compile_cmd:
+            if arg == output:
+                # the binary name doesn't affect the result
+                arg = '<output>'
+            h.update(arg.encode() + b'\0')
+            if arg != '<output>' and os.path.isfile(_resolve(arg)):
+                with open(_resolve(arg), 'rb') as f:
+                    h.update(hashlib.file_digest(f, 'sha256').digest())
+        # included headers, so that editing one doesn't reuse a stale binary
+        for path in self._header_dependencies():
+            h.update(path.encode() + b'\0')
+            if os.path.isfile(_resolve(path)):
+                with open(_resolve(path), 'rb') as f:
+                    h.update(hashlib.file_digest(f, 'sha256').digest())
+        return h.hexdigest()
+
     def compile(self):
+        """
+        Compile, reusing the binary from COMPILE_CACHE_DIR if the compile command,
+        compiler version, sources and included headers didn't change.
+        """
         if self.compile_cmd is None:
             return
-        return subprocess.check_output(self.compile_cmd).decode()
+        output = self._compile_output()
+        if COMPILE_CACHE_DIR is None or output is None:
+            return subprocess.check_output(self.compile_cmd, cwd=_cwd()).decode()
 
-def py_runner(src_path: str):
+        output = _resolve(output)
+        cached = os.path.join(COMPILE_CACHE_DIR, self._compile_key())
+        if os.path.exists(cached):
+            shutil.copy2(cached, output)
+            return ''
+        out = subprocess.check_output(self.compile_cmd, cwd=_cwd()).decode()
+        os.makedirs(COMPILE_CACHE_DIR, exist_ok=True)
+        # copy then rename, so a concurrent compile never sees a partial binary
+        with tempfile.NamedTemporaryFile(dir=COMPILE_CACHE_DIR, delete=False) as tmp:
+            tmp_path = tmp.name
+        shutil.copy2(output, tmp_path)
+        os.replace(tmp_path, cached)
+        return out
+
+class PersistentPyRunner(Runner):
+    """
+    Runs a python solution through a long lived fork server (see warm_worker), which
+    compiles the solution and imports its modules once. Each run is a fresh process
+    forked from the server, so runs are as isolated as with a normal Runner, without
+    paying for interpreter startup.
+    """
+    def __init__(self, src_path: str):
+        super().__init__([sys.executable, src_path], None)
+        self.src_path = src_path
+        self._sock: socket.socket|None = None
+        self._server: subprocess.Popen|None = None
+        # pid of the process that started the server, forked processes need their own
+        self._owner_pid = -1
+        self._lock = threading.Lock()
+
+    def _connect(self) -> socket.socket:
+        if self._sock is not None and self._owner_pid == os.getpid():
+            return self._sock
+        sock, server_sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        # every run is forked from the server, so they all run in the directory the
+        # runner was first used in
+        self._server = subprocess.Popen(
+                [sys.executable, os.path.join(os.path.dirname(__file__), 'warm_worker.py'),
+                 str(server_sock.fileno()), self.src_path],
+                pass_fds=[server_sock.fileno()],
+                cwd=_cwd())
+        server_sock.close()
+        self._sock = sock
+        self._owner_pid = os.getpid()
+        return sock
+
+    def close(self):
+        """Stop the fork server. It's restarted if the runner is used again."""
+        if self._sock is not None and self._owner_pid == os.getpid():
+            self._sock.close()
+            assert self._server is not None
+            self._server.wait()
+        self._sock = None
+        self._server = None
+
+    def exec(self, timeout: float|None = None):
+        return self._exec_output(None, timeout)
+
+    def exec_file(self, infile: str, timeout: float|None = None):
+        return self._exec_output(infile, timeout)
+
+    def _exec_output(self, infile: str|None, timeout: float|None) -> str:
+        with tempfile.TemporaryFile() as out:
+            self.exec_to_file(infile or os.devnull, out, timeout)
+            out.seek(0)
+            return out.read().decode()
+
+    def _exec_measured(self, stdin, stdout, time_limit, mem_limit) -> ExecResult:
+        if stdout == subprocess.DEVNULL:
+            with open(os.devnull, 'wb') as devnull:
+                return self._exec_measured(stdin, devnull, time_limit, mem_limit)
+        with self._lock:
+            sock = self._connect()
+            start = time.perf_counter()
+            request = {'time_limit': time_limit, 'mem_limit': mem_limit}
+            socket.send_fds(sock, [json.dumps(request).encode()], [stdin.fileno(), stdout.fileno()])
+            pid = json.loads(sock.recv(4096))['pid']
+
+            timed_out = threading.Event()
+            def kill():
+                timed_out.set()
+                os.kill(pid, signal.SIGKILL)
+            timer = None
+            if time_limit is not None:
+                timer = threading.Timer(2 * time_limit, kill)
+                timer.start()
+            try:
+                reply = sock.recv(4096)
+            finally:
+                if timer is not None:
+                    timer.cancel()
+            wall_time = time.perf_counter() - start
+        if not reply:
+            raise RuntimeError(f'Fork server for {self.src_path} exited unexpectedly')
+        reply = json.loads(reply)
+
+        returncode = reply['status']
+        # the child is forked without exec, so this also counts the memory of the fork
+        # server: the interpreter, the preloaded imports of the solution (as in a
+        # standalone run) and the few modules of the server itself
+        maxrss = reply['maxrss']
+        peak_rss = maxrss if sys.platform == 'darwin' else maxrss * 1024
+        exceeded_cpu = time_limit is not None and (
+                reply['cpu_time'] > time_limit or returncode == -signal.SIGXCPU)
+        return ExecResult(
+                returncode,
+                wall_time,
+                reply['cpu_time'],
+                peak_rss,
+                timed_out.is_set() or exceeded_cpu)
+
+def py_runner(src_path: str, persistent: bool = False):
+    """If persistent, runs go through a fork server with the solution preloaded
+    (see PersistentPyRunner)."""
+    if persistent:
+        return PersistentPyRunner(src_path)
     return Runner([sys.executable, src_path], None)
 
 def cpp_runner(src_path: str, bin_name: str):
@@ -63,7 +528,33 @@ def cpp_runner(src_path: str, bin_name: str):
             [CC, '-Wall', '-Wshadow', '-Wextra', '-O2', '-o', bin_name, src_path]
             )
 
-def compile_all():
-    for runner in _ALL_EXECUTABLES:
-        runner.compile()
+def submission_runner(src_path: str, build_dir: str) -> Runner|None:
+    """
+    Runner for a submission based on its extension, not registered in the list of
+    all executables. Binaries are written to build_dir. None if the language isn't
+    supported.
+    """
+    name, ext = os.path.splitext(os.path.basename(src_path))
+    if ext == '.py':
+        return Runner([sys.executable, src_path], None, register=False)
+    if ext == '.cpp':
+        bin_name = os.path.join(os.path.abspath(build_dir), name + '.bin')
+        return Runner(
+                [bin_name],
+                [CC, '-O2', '-o', bin_name, src_path],
+                register=False)
+    if ext == '.java':
+        # single-file source code mode, the same as the check script
+        return Runner([JAVA, src_path], None, register=False)
+    return None
+
+def compile_all(workers: int = 1):
+    """Compile all registered runners, with workers compilations at once. Relative
+    paths are resolved against the working directory of the calling thread."""
+    cwd = _cwd()
+    def compile(runner: Runner):
+        with working_dir(cwd):
+            return runner.compile()
+    with ThreadPoolExecutor(workers) as pool:
+        list(pool.map(compile, _ALL_EXECUTABLES))
 
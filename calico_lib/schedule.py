@@ -0,0 +1,137 @@
+"""
+Runs the stages of a build as a DAG of tasks on a shared thread pool, so that
+independent stages overlap, e.g. generating the tests of one problem while the zip of
+another is uploaded.
+"""
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+import time
+import traceback
+
+@dataclass(eq=False)
+class Task:
+    name: str
+    fn: Callable[[], object]
+    deps: list['Task'] = field(default_factory=list)
+    # run alone, with no other task running at the same time, e.g. a task that forks
+    exclusive: bool = False
+    # 'pending', 'ok', 'failed', or 'skipped' if a dependency didn't succeed
+    status: str = 'pending'
+    # seconds since the start of run_tasks
+    start: float|None = None
+    end: float|None = None
+    error: str|None = None
+
+    @property
+    def duration(self) -> float:
+        if self.start is None or self.end is None:
+            return 0.0
+        return self.end - self.start
+
+def run_tasks(tasks: list[Task], jobs: int = 1) -> bool:
+    """
+    Run every task once all of its dependencies succeeded, with at most jobs tasks
+    running at once. Ready tasks are started in the order of tasks. An exclusive task
+    waits for the running tasks to finish, and no other task starts until it's done.
+    A task that raises fails, and the tasks depending on it are skipped. Returns
+    whether all tasks succeeded.
+    """
+    for task in tasks:
+        for dep in task.deps:
+            assert dep in tasks, f'{task.name} depends on {dep.name}, which is not scheduled'
+    dependents: dict[Task, list[Task]] = {task: [] for task in tasks}
+    waiting_on = {task: len(task.deps) for task in tasks}
+    for task in tasks:
+        for dep in task.deps:
+            dependents[dep].append(task)
+
+    start = time.perf_counter()
+    def run(task: Task):
+        print(f'\n=== {task.name} ===')
+        task.start = time.perf_counter() - start
+        try:
+            task.fn()
+            task.status = 'ok'
+        except Exception:
+            task.status = 'failed'
+            task.error = traceback.format_exc()
+        finally:
+            task.end = time.perf_counter() - start
+
+    def skip(task: Task):
+        task.status = 'skipped'
+        for dependent in dependents[task]:
+            if dependent.status == 'pending':
+                skip(dependent)
+
+    running: dict[Future, Task] = {}
+    started: set[Task] = set()
+    with ThreadPoolExecutor(max(jobs, 1)) as pool:
+        def submit_ready():
+            for task in tasks:
+                if task.status != 'pending' or task in started or waiting_on[task] > 0:
+                    continue
+                if any(other.exclusive for other in running.values()):
+                    return
+                if task.exclusive and running:
+                    # tasks after it wait too, so that it gets to run
+                    return
+                started.add(task)
+                running[pool.submit(run, task)] = task
+
+        submit_ready()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                task = running.pop(future)
+                if task.status != 'ok':
+                    for dependent in dependents[task]:
+                        if dependent.status == 'pending':
+                            skip(dependent)
+                    continue
+                for dependent in dependents[task]:
+                    waiting_on[dependent] -= 1
+            submit_ready()
+    return all(task.status == 'ok' for task in tasks)
+
+def critical_path(tasks: list[Task]) -> list[Task]:
+    """
+    The chain of tasks that determined the total time: the last task to finish, the
+    dependency of it that finished last, and so on.
+    """
+    finished = [task for task in tasks if task.end is not None]
+    if not finished:
+        return []
+    task = max(finished, key=lambda task: task.end or 0)
+    path = [task]
+    while True:
+        deps = [dep for dep in task.deps if dep.end is not None]
+        if not deps:
+            break
+        task = max(deps, key=lambda task: task.end or 0)
+        path.append(task)
+    return path[::-1]
+
+def print_report(tasks: list[Task]):
+    """Print the critical path, with the time each task waited for a free job after
+    its dependencies finished, and the failed and skipped tasks."""
+    path = critical_path(tasks)
+    if not path:
+        return
+    wall_time = max(task.end or 0 for task in tasks)
+    busy_time = sum(task.duration for task in tasks)
+    width = max(len(task.name) for task in path)
+    print(f'Critical path ({wall_time:.2f}s total, {busy_time:.2f}s of work, '
+          f'average parallelism {busy_time / max(wall_time, 1e-9):.1f}):')
+    for task in path:
+        ready = max((dep.end or 0 for dep in task.deps), default=0.0)
+        waited = (task.start or 0) - ready
+        print(f'  {task.name:<{width}}  {task.duration:8.2f}s  (waited {waited:.2f}s)')
+    for task in tasks:
+        if task.status == 'failed':
+            print(f'\n--- {task.name} failed ---')
+            print(task.error)
+    skipped = [task.name for task in tasks if task.status == 'skipped']
+    if skipped:
+        print(f'Skipped because a dependency failed: {", ".join(skipped)}')
@@ -0,0 +1,184 @@
+"""
+Strict reader for input validators, in the style of testlib.
+
+The input file is memory mapped and read token by token. Whitespace is never skipped
+implicitly: every space, end of line and the end of file must be read explicitly, so
+a file that passes has exactly the expected format. Typed readers check ranges.
+read_ints reads a whole line of numbers at once, and read_int_columns many lines of
+numbers at once: a 100MB file of 4 million lines of two integers takes about 6s with
+read_int_columns, and about 20s with read_ints and read_eol for every line.
+
+    with InputReader(infile) as r:
+        T = r.read_int(1, 10**6)
+        r.read_eol()
+        A, B = r.read_int_columns(T, 2, 1, 10**12)
+        r.read_eof()
+"""
+from functools import lru_cache
+import mmap
+import re
+from typing import NoReturn
+
+_WHITESPACE = rb' \t\r\n\f\v'
+# no leading zeros, no -0
+_INT = rb'(?:0|-?[1-9][0-9]*)'
+# an integer has to be the whole token
+_END_OF_TOKEN = rb'(?![^' + _WHITESPACE + rb'])'
+_INT_RE = re.compile(_INT + _END_OF_TOKEN)
+_TOKEN_RE = re.compile(rb'[^' + _WHITESPACE + rb']+')
+_LINE_RE = re.compile(rb'[^\n]*')
+
+class ValidationError(AssertionError):
+    pass
+
+@lru_cache(maxsize=64)
+def _ints_re(n: int, sep: bytes) -> re.Pattern:
+    # a counted repeat, so the pattern (and its compile time) doesn't grow with n
+    return re.compile(_INT + rb'(?:' + re.escape(sep) + _INT + rb'){' + str(n - 1).encode() + rb'}'
+                      + _END_OF_TOKEN)
+
+@lru_cache(maxsize=64)
+def _int_lines_re(n: int, k: int, sep: bytes) -> re.Pattern:
+    # the separators and ends of line already end every integer
+    line = _INT + rb'(?:' + re.escape(sep) + _INT + rb'){' + str(k - 1).encode() + rb'}\n'
+    return re.compile(rb'(?:' + line + rb'){' + str(n).encode() + rb'}')
+
+class InputReader:
+    """Reads the file at path. Can be used as a context manager, which closes it."""
+    def __init__(self, path: str):
+        self.path = path
+        self.pos = 0
+        with open(path, 'rb') as f:
+            try:
+                self._mm: mmap.mmap|None = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._data = self._mm
+            except ValueError:
+                # empty files can't be mapped
+                self._mm = None
+                self._data = b''
+        self._size = len(self._data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+            self._data = b''
+
+    def fail(self, message: str) -> NoReturn:
+        """Raise a ValidationError for the current position."""
+        line = self._data[:self.pos].count(b'\n') + 1
+        raise ValidationError(f'{self.path}:{line}: {message}')
+
+    def _peek(self, length: int = 20) -> str:
+        if self.pos >= self._size:
+            return 'end of file'
+        return repr(bytes(self._data[self.pos:self.pos + length]))
+
+    def _expect(self, char: bytes, name: str):
+        if self._data[self.pos:self.pos + 1] != char:
+            self.fail(f'expected {name}, got {self._peek()}')
+        self.pos += 1
+
+    def read_space(self):
+        self._expect(b' ', 'a space')
+
+    def read_eol(self):
+        self._expect(b'\n', 'end of line')
+
+    def read_eof(self):
+        if self.pos != self._size:
+            self.fail(f'expected end of file, got {self._peek()}')
+
+    def read_token(self) -> bytes:
+        """A run of non whitespace characters."""
+        match = _TOKEN_RE.match(self._data, self.pos)
+        if match is None:
+            self.fail(f'expected a token, got {self._peek()}')
+        self.pos = match.end()
+        return match.group()
+
+    def read_int(self, lo: int, hi: int) -> int:
+        """An integer in [lo, hi], without leading zeros."""
+        match = _INT_RE.match(self._data, self.pos)
+        if match is None:
+            self.fail(f'expected an integer, got {self._peek()}')
+        value = int(match.group())
+        if not lo <= value <= hi:
+            self.fail(f'integer {value} not in [{lo}, {hi}]')
+        self.pos = match.end()
+        return value
+
+    def read_ints(self, n: int, lo: int, hi: int, sep: str = ' ') -> list[int]:
+        """n integers in [lo, hi] separated by sep, parsed at once."""
+        if n == 0:
+            return []
+        match = _ints_re(n, sep.encode()).match(self._data, self.pos)
+        if match is None:
+            # find the first bad integer for the message
+            for i in range(n):
+                if i > 0:
+                    self._expect(sep.encode(), repr(sep))
+                self.read_int(lo, hi)
+            self.fail(f'expected {n} integers')
+        values = list(map(int, match.group().split(sep.encode())))
+        if min(values) < lo or max(values) > hi:
+            for i, value in enumerate(values):
+                if not lo <= value <= hi:
+                    self.fail(f'integer {i + 1} of {n}, {value}, not in [{lo}, {hi}]')
+        self.pos = match.end()
+        return values
+
+    def read_int_columns(self, n: int, k: int, lo: int, hi: int, sep: str = ' ') -> list[list[int]]:
+        """n lines of k integers in [lo, hi] separated by sep, each followed by an end
+        of line, the same as n times read_ints then read_eol, but parsed at once.
+        Returns the k columns, e.g. A, B = r.read_int_columns(N, 2, 1, 10**9)."""
+        if n == 0 or k == 0:
+            for _ in range(n):
+                self.read_eol()
+            return [[] for _ in range(k)]
+        match = _int_lines_re(n, k, sep.encode()).match(self._data, self.pos)
+        values = list(map(int, match.group().split())) if match is not None else []
+        if match is None or min(values) < lo or max(values) > hi:
+            # read line by line for the position of the error
+            for _ in range(n):
+                self.read_ints(k, lo, hi, sep)
+                self.read_eol()
+            self.fail(f'expected {n} lines of {k} integers')
+        self.pos = match.end()
+        return [values[i::k] for i in range(k)]
+
+    def _check_str(self, value: bytes, charset: str|None, minlen: int, maxlen: int|None, what: str) -> str:
+        if len(value) < minlen or (maxlen is not None and len(value) > maxlen):
+            self.fail(f'{what} of length {len(value)} not in [{minlen}, {maxlen}]')
+        if charset is not None and value.translate(None, charset.encode()):
+            bad = value.translate(None, charset.encode())[:1]
+            self.fail(f'{what} contains {bad!r}, not in charset {charset!r}')
+        try:
+            return value.decode()
+        except UnicodeDecodeError:
+            self.fail(f'{what} is not valid UTF-8')
+
+    def read_str(self, charset: str|None = None, maxlen: int|None = None, minlen: int = 1) -> str:
+        """A token of length in [minlen, maxlen] (bytes) made of characters in charset,
+        by default any non whitespace character."""
+        return self._check_str(self.read_token(), charset, minlen, maxlen, 'string')
+
+    def read_line(self, charset: str|None = None, maxlen: int|None = None, minlen: int = 0) -> str:
+        """The rest of the line, without the end of line, which still has to be read."""
+        match = _LINE_RE.match(self._data, self.pos)
+        assert match is not None
+        value = self._check_str(match.group(), charset, minlen, maxlen, 'line')
+        self.pos = match.end()
+        return value
+
+def validate(path: str, fn):
+    """Call fn with an InputReader of path, then check that the whole file was read."""
+    with InputReader(path) as reader:
+        fn(reader)
+        reader.read_eof()
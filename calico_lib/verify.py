@@ -0,0 +1,276 @@
+from concurrent.futures import ThreadPoolExecutor
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from typing import NamedTuple
+
+from .runner import Runner, submission_runner
+
+# Expected verdict of the submissions in each folder of submissions/
+FOLDER_VERDICTS = {
+        'accepted': 'AC',
+        'wrong_answer': 'WA',
+        'time_limit_exceeded': 'TLE',
+        'run_time_error': 'RTE',
+        }
+
+class Submission(NamedTuple):
+    path: str
+    expected: str
+    runner: Runner
+
+def find_submissions(problem_dir: str, build_dir: str) -> list[Submission]:
+    """Find all submissions with a supported language in the verdict folders."""
+    submissions = []
+    for folder, expected in FOLDER_VERDICTS.items():
+        folder_path = os.path.join(problem_dir, 'submissions', folder)
+        if not os.path.isdir(folder_path):
+            continue
+        folder_build_dir = os.path.join(build_dir, folder)
+        os.makedirs(folder_build_dir, exist_ok=True)
+        for name in sorted(os.listdir(folder_path)):
+            path = os.path.join(folder_path, name)
+            runner = submission_runner(path, folder_build_dir)
+            if runner is None:
+                print(f'Warning: skipping submission {path}, unsupported language')
+                continue
+            if shutil.which(runner.run_cmd[0]) is None and runner.compile_cmd is None:
+                print(f'Warning: skipping submission {path}, {runner.run_cmd[0]} not found')
+                continue
+            submissions.append(Submission(path, expected, runner))
+    return submissions
+
+def compile_submission(submission: Submission) -> bool:
+    try:
+        submission.runner.compile()
+    except (subprocess.CalledProcessError, FileNotFoundError) as e:
+        print(f'Compilation failed for {submission.path}: {e}')
+        return False
+    return True
+
+def same_output(out_path: str, ans_path: str) -> bool:
+    """Compare outputs the same way as the DOMjudge default validator, ignoring
+    differences in whitespace."""
+    with open(out_path, 'rb') as out, open(ans_path, 'rb') as ans:
+        return out.read().split() == ans.read().split()
+
+def judge(runner: Runner, test: str, time_limit: float, out_path: str) -> str:
+    """Run the test at path test (without extension), returns the verdict."""
+    result = runner.exec_measured(test + '.in', out_path, time_limit)
+    if result.timed_out:
+        return 'TLE'
+    if result.returncode != 0:
+        return 'RTE'
+    if not same_output(out_path, test + '.ans'):
+        return 'WA'
+    return 'AC'
+
+def judge_order(problem, test_set) -> list[str]:
+    """The tests of test_set in the order the judge runs them: samples first, then
+    by path."""
+    sample_dir = os.path.normpath(problem._sample_path)
+    return sorted(problem.test_paths[test_set.name],
+                  key=lambda test: (os.path.dirname(os.path.normpath(test)) != sample_dir, test))
+
+def verify_submissions(problem, workers: int = 1) -> bool:
+    """
+    Run every submission in the verdict folders against the tests of every test set
+    of problem, with at most workers submissions running at once. Prints a verdict
+    matrix and returns whether every submission got the verdict of its folder.
+
+    The verdict of a submission on a test set is its verdict on the first failing test
+    in judge order (see judge_order), the same as on the judge. Tests are run from
+    smallest to largest input, and once a submission failed a test, the tests after it
+    in judge order are skipped.
+    """
+    problem_dir = problem.problem_dir
+    with tempfile.TemporaryDirectory() as build_dir:
+        submissions = find_submissions(problem_dir, build_dir)
+        with ThreadPoolExecutor(workers) as pool:
+            compiled = list(pool.map(compile_submission, submissions))
+
+        # first_failure[(submission index, test set name)] = (index in judge order,
+        # verdict) of the earliest failing test found so far
+        first_failure: dict[tuple[int, str], tuple[int, str]] = {}
+        lock = threading.Lock()
+
+        def run_task(task):
+            i, test_set, index, test, out_path = task
+            key = (i, test_set.name)
+            with lock:
+                if key in first_failure and first_failure[key][0] < index:
+                    return
+            verdict = judge(submissions[i].runner, test, test_set.time_limit, out_path)
+            os.remove(out_path)
+            if verdict != 'AC':
+                with lock:
+                    if key not in first_failure or index < first_failure[key][0]:
+                        first_failure[key] = (index, verdict)
+
+        verdicts: dict[tuple[int, str], str] = {}
+        tasks = []
+        for test_set in problem.test_sets:
+            tests = judge_order(problem, test_set)
+            # input size as an estimate of the running time
+            by_size = sorted(range(len(tests)),
+                             key=lambda index: os.path.getsize(os.path.join(problem_dir, tests[index] + '.in')))
+            for rank, index in enumerate(by_size):
+                for i in range(len(submissions)):
+                    if not compiled[i]:
+                        verdicts[(i, test_set.name)] = 'CE'
+                        continue
+                    out_path = os.path.join(build_dir, f'{i}_{test_set.name}_{index}.out')
+                    test = os.path.join(problem_dir, tests[index])
+                    tasks.append((rank, (i, test_set, index, test, out_path)))
+        # fastest tests of every submission first, so failures are found early
+        tasks.sort(key=lambda task: task[0])
+        with ThreadPoolExecutor(workers) as pool:
+            list(pool.map(run_task, [task for _, task in tasks]))
+        for key, (_, verdict) in first_failure.items():
+            verdicts[key] = verdict
+
+    return print_verdicts(problem, submissions, verdicts)
+
+def print_verdicts(problem, submissions: list[Submission], verdicts) -> bool:
+    names = [os.path.relpath(s.path, os.path.join(problem.problem_dir, 'submissions'))
+             for s in submissions]
+    width = max([len(name) for name in names] + [len('submission')])
+    col_widths = [max(len(test_set.name), 4) for test_set in problem.test_sets]
+    header = f'{"submission":<{width}}  {"expected":<8}' + ''.join(
+            f'  {test_set.name:<{col}}' for test_set, col in zip(problem.test_sets, col_widths))
+    print(header)
+    print('-' * len(header))
+    ok = True
+    for i, submission in enumerate(submissions):
+        row = f'{names[i]:<{width}}  {submission.expected:<8}'
+        for test_set, col in zip(problem.test_sets, col_widths):
+            verdict = verdicts.get((i, test_set.name), 'AC')
+            mark = ' '
+            if verdict != submission.expected:
+                mark = '!'
+                ok = False
+            row += f'  {verdict + mark:<{col}}'
+        print(row)
+    if not ok:
+        print('Some submissions did not get their expected verdict (marked with !)')
+    return ok
+
+def _median(values: list[float]) -> float:
+    values = sorted(values)
+    mid = len(values) // 2
+    if len(values) % 2 == 1:
+        return values[mid]
+    return (values[mid - 1] + values[mid]) / 2
+
+def calibrate_time_limits(problem,
+                          workers: int = 1,
+                          runs: int = 3,
+                          multiplier: float = 2.0,
+                          margin: float = 0.0,
+                          max_time: float = 10.0) -> dict[str, float]:
+    """
+    Run every accepted submission runs times on each secret test, and recommend a time
+    limit for each test set: the slowest median CPU time of an accepted submission on a
+    test of the test set, times multiplier, plus margin (seconds), rounded up to a
+    tenth of a second. Runs are stopped after max_time, and not repeated once one was.
+
+    Then run every time limit exceeded submission once on each secret test with the
+    recommended limit, and warn about those that would pass it. Prints the timings and
+    returns the recommended time limit of each test set, except the test sets without
+    accepted submissions or secret tests, which are skipped.
+    """
+    problem_dir = problem.problem_dir
+    sample_dir = os.path.normpath(problem._sample_path)
+    with tempfile.TemporaryDirectory() as build_dir:
+        submissions = [s for s in find_submissions(problem_dir, build_dir)
+                       if s.expected in ('AC', 'TLE')]
+        with ThreadPoolExecutor(workers) as pool:
+            compiled = list(pool.map(compile_submission, submissions))
+        submissions = [s for s, ok in zip(submissions, compiled) if ok]
+        accepted = [i for i, submission in enumerate(submissions) if submission.expected == 'AC']
+
+        tests = set()
+        for test_set in problem.test_sets:
+            for test in problem.test_paths[test_set.name]:
+                if os.path.dirname(os.path.normpath(test)) != sample_dir:
+                    tests.add(test)
+
+        def run(i: int, test: str, time_limit: float):
+            return submissions[i].runner.exec_measured(
+                    os.path.join(problem_dir, test + '.in'), None, time_limit)
+
+        def median_time(task) -> float:
+            i, test = task
+            times = []
+            for _ in range(runs):
+                times.append(min(run(i, test, max_time).cpu_time, max_time))
+                if times[-1] >= max_time:
+                    # repeating a run that hit the cap gives the same time
+                    break
+            return _median(times)
+
+        tasks = [(i, test) for test in sorted(tests) for i in accepted]
+        with ThreadPoolExecutor(workers) as pool:
+            medians = dict(zip(tasks, pool.map(median_time, tasks)))
+
+        recommended = {}
+        for test_set in problem.test_sets:
+            set_tests = [test for test in problem.test_paths[test_set.name] if test in tests]
+            if not accepted or not set_tests:
+                print(f'Warning: test set "{test_set.name}" has no '
+                      f'{"accepted submissions" if not accepted else "secret tests"}, '
+                      f'keeping its time limit of {test_set.time_limit}s')
+                continue
+            slowest = 0.0
+            slowest_test = None
+            for i in accepted:
+                for test in set_tests:
+                    if medians[(i, test)] > slowest:
+                        slowest, slowest_test = medians[(i, test)], test
+            # never 0, which would kill every run through RLIMIT_CPU
+            limit = max(math.ceil((slowest * multiplier + margin) * 10) / 10, 0.1)
+            recommended[test_set.name] = limit
+            print(f'Test set "{test_set.name}": slowest accepted median {slowest:.3f}s '
+                  f'on {slowest_test}, recommended time limit {limit}s '
+                  f'(currently {test_set.time_limit}s)')
+
+        # slowest time of each time limit exceeded submission on each test set, once
+        # a test took longer than the limit the remaining tests are skipped
+        tle_times: dict[tuple[int, str], float] = {}
+        lock = threading.Lock()
+
+        def run_tle(task):
+            i, test_set_name, test = task
+            key = (i, test_set_name)
+            limit = recommended[test_set_name]
+            with lock:
+                if tle_times.get(key, 0.0) > limit:
+                    return
+            result = run(i, test, limit)
+            time = math.inf if result.timed_out else result.cpu_time
+            with lock:
+                tle_times[key] = max(tle_times.get(key, 0.0), time)
+
+        tle_tasks = []
+        for test_set in problem.test_sets:
+            if test_set.name not in recommended:
+                continue
+            set_tests = [test for test in problem.test_paths[test_set.name] if test in tests]
+            # largest inputs first, as the most likely to exceed the limit
+            set_tests.sort(key=lambda test: -os.path.getsize(os.path.join(problem_dir, test + '.in')))
+            for test in set_tests:
+                for i, submission in enumerate(submissions):
+                    if submission.expected == 'TLE':
+                        tle_tasks.append((i, test_set.name, test))
+        with ThreadPoolExecutor(workers) as pool:
+            list(pool.map(run_tle, tle_tasks))
+
+    for (i, test_set_name), tle_time in sorted(tle_times.items()):
+        limit = recommended[test_set_name]
+        if tle_time <= limit:
+            print(f'  Warning: {submissions[i].path} takes at most {tle_time:.3f}s on test set '
+                  f'"{test_set_name}", it would pass the recommended limit of {limit}s')
+    return recommended
@@ -0,0 +1,110 @@
+"""
+Fork server for python solutions, used by py_runner(..., persistent=True).
+
+The server compiles the solution and imports its top level imports once. For each
+run, it receives the stdin and stdout file descriptors over a unix socket, forks a
+child that runs the solution as __main__ with those descriptors, and replies with the
+exit status and resource usage of the child. Each run is still a separate process.
+
+Protocol, one JSON object per packet on a SOCK_SEQPACKET socket:
+    client -> server: {"time_limit": float|null, "mem_limit": int|null} + 2 fds
+    server -> client: {"pid": int}, then once the child exits
+                      {"status": int, "cpu_time": float, "maxrss": int}
+"""
+import ast
+import builtins
+import json
+import os
+import socket
+import sys
+import traceback
+
+if __package__:
+    from .rlimits import set_limits
+else:
+    # run as a script by PersistentPyRunner, so that the calico_lib package isn't
+    # imported into the server and every run forked from it
+    from rlimits import set_limits
+
+def _warm_up(tree: ast.Module):
+    """Import the top level imports of the solution, so forked children share them."""
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            try:
+                exec(compile(ast.Module([node], []), '<warm up>', 'exec'), {})
+            except Exception:
+                pass
+
+def _run_child(code, src_path: str, stdin_fd: int, stdout_fd: int, time_limit, mem_limit):
+    os.dup2(stdin_fd, 0)
+    os.dup2(stdout_fd, 1)
+    os.close(stdin_fd)
+    os.close(stdout_fd)
+    set_limits(time_limit, mem_limit)
+    sys.stdin = open(0, 'r', encoding='utf-8', closefd=False)
+    sys.stdout = open(1, 'w', encoding='utf-8', closefd=False)
+    sys.argv = [src_path]
+    exit_code = 0
+    try:
+        exec(code, {'__name__': '__main__', '__file__': src_path, '__builtins__': builtins})
+    except SystemExit as e:
+        if e.code is None:
+            exit_code = 0
+        elif isinstance(e.code, int):
+            exit_code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            exit_code = 1
+    except BaseException as e:
+        # without the frame of this function, the same as running the script
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next if e.__traceback__ else None)
+        exit_code = 1
+    try:
+        sys.stdout.flush()
+    except Exception:
+        exit_code = exit_code or 1
+    os._exit(exit_code)
+
+def _load(src_path: str):
+    """Compile the solution and import its top level imports."""
+    with open(src_path, encoding='utf-8') as f:
+        source = f.read()
+    tree = ast.parse(source, src_path)
+    code = compile(tree, src_path, 'exec')
+    # same as running the solution as a script
+    sys.path[0] = os.path.dirname(os.path.abspath(src_path))
+    _warm_up(tree)
+    return code
+
+def serve(sock: socket.socket, src_path: str):
+    code = _load(src_path)
+
+    while True:
+        msg, fds, _, _ = socket.recv_fds(sock, 1 << 16, 2)
+        if not msg:
+            return
+        request = json.loads(msg)
+        stdin_fd, stdout_fd = fds
+        pid = os.fork()
+        if pid == 0:
+            sock.close()
+            _run_child(code, src_path, stdin_fd, stdout_fd,
+                       request['time_limit'], request['mem_limit'])
+        os.close(stdin_fd)
+        os.close(stdout_fd)
+        sock.send(json.dumps({'pid': pid}).encode())
+        _, status, usage = os.wait4(pid, 0)
+        reply = {
+                'status': os.waitstatus_to_exitcode(status),
+                'cpu_time': usage.ru_utime + usage.ru_stime,
+                'maxrss': usage.ru_maxrss,
+                }
+        sock.send(json.dumps(reply).encode())
+
+def main():
+    fd, src_path = int(sys.argv[1]), sys.argv[2]
+    sock = socket.socket(fileno=fd)
+    serve(sock, src_path)
+
+if __name__ == '__main__':
+    main()
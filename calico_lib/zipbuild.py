@@ -0,0 +1,121 @@
+"""
+Zip writer that reuses compressed data across zips.
+
+Each file is deflated once into a CompressedEntry, which can then be written to any
+number of zips without compressing it again. Zips are reproducible: entries are sorted
+and have a fixed timestamp and permissions, so the same files always give the same
+bytes. Only what DOMjudge problem zips need is supported: deflated entries, no ZIP64
+(every file and zip must be under 4GB).
+"""
+import hashlib
+import os
+import struct
+import zipfile
+import zlib
+from typing import NamedTuple
+
+_CHUNK_SIZE = 1 << 20
+_ZIP32_LIMIT = 0xFFFFFFFF
+# earliest date representable in a zip
+FIXED_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+class CompressedEntry(NamedTuple):
+    name: str
+    date_time: tuple[int, int, int, int, int, int]
+    external_attr: int
+    crc: int
+    file_size: int
+    # raw deflate stream
+    data: bytes
+
+def arcname_of(path: str, arcname: str|None = None) -> str:
+    """Name of the file at path in a zip, normalized the same way as ZipFile.write."""
+    name = arcname if arcname is not None else path
+    name = os.path.normpath(os.path.splitdrive(name)[1]).lstrip(os.sep)
+    return zipfile.ZipInfo(name).filename
+
+def _external_attr(path: str) -> int:
+    # only keep whether the file is executable, so umasks don't affect the zip
+    mode = 0o100755 if os.access(path, os.X_OK) else 0o100644
+    return mode << 16
+
+def file_sha256(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+def compress_file(path: str, arcname: str|None = None, level: int = 6) -> CompressedEntry:
+    """Compress the file at path, stored in zips as arcname (by default the path, the
+    same as ZipFile.write)."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    crc = 0
+    size = 0
+    chunks = []
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(_CHUNK_SIZE)
+            if not chunk:
+                break
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            chunks.append(compressor.compress(chunk))
+    chunks.append(compressor.flush())
+    return CompressedEntry(arcname_of(path, arcname), FIXED_DATE_TIME, _external_attr(path),
+                           crc, size, b''.join(chunks))
+
+def compress_bytes(arcname: str,
+                   data: bytes,
+                   level: int = 6) -> CompressedEntry:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    compressed = compressor.compress(data) + compressor.flush()
+    # regular file, rw-r--r--
+    external_attr = (0o100644 << 16)
+    return CompressedEntry(arcname_of(arcname), FIXED_DATE_TIME, external_attr, zlib.crc32(data), len(data), compressed)
+
+def _dos_date_time(date_time) -> tuple[int, int]:
+    year, month, day, hour, minute, second = date_time
+    dos_date = (max(year, 1980) - 1980) << 9 | month << 5 | day
+    dos_time = hour << 11 | minute << 5 | second // 2
+    return dos_date, dos_time
+
+def write_zip(zip_path: str, entries: list[CompressedEntry]):
+    """Write a zip containing entries, sorted by name."""
+    assert len(entries) < 0xFFFF, 'Too many files for a zip without ZIP64'
+    central_dir = []
+    with open(zip_path, 'wb') as f:
+        for entry in sorted(entries, key=lambda entry: entry.name):
+            assert entry.file_size < _ZIP32_LIMIT and len(entry.data) < _ZIP32_LIMIT, \
+                    f'{entry.name} is too large for a zip without ZIP64'
+            offset = f.tell()
+            assert offset < _ZIP32_LIMIT, 'Zip is too large without ZIP64'
+            name = entry.name.encode('utf-8')
+            # bit 11: file name is utf-8
+            flags = 0x800 if not entry.name.isascii() else 0
+            dos_date, dos_time = _dos_date_time(entry.date_time)
+            f.write(struct.pack('<IHHHHHIIIHH',
+                                0x04034b50, 20, flags, zipfile.ZIP_DEFLATED,
+                                dos_time, dos_date, entry.crc,
+                                len(entry.data), entry.file_size, len(name), 0))
+            f.write(name)
+            f.write(entry.data)
+            central_dir.append(struct.pack('<IHHHHHHIIIHHHHHII',
+                                           0x02014b50, (3 << 8) | 20, 20, flags,
+                                           zipfile.ZIP_DEFLATED, dos_time, dos_date,
+                                           entry.crc, len(entry.data), entry.file_size,
+                                           len(name), 0, 0, 0, 0, entry.external_attr,
+                                           offset) + name)
+        cd_offset = f.tell()
+        for header in central_dir:
+            f.write(header)
+        cd_size = f.tell() - cd_offset
+        assert cd_offset < _ZIP32_LIMIT, 'Zip is too large without ZIP64'
+        f.write(struct.pack('<IHHHHIIH',
+                            0x06054b50, 0, 0, len(entries), len(entries),
+                            cd_size, cd_offset, 0))
+
+def list_files(path: str) -> list[str]:
+    """All files under the directory path, in the order os.walk finds them."""
+    files = []
+    for root, _, names in os.walk(path):
+        for name in names:
+            files.append(os.path.join(root, name))
+    return files
@@ -45,7 +45,7 @@ class Test(TestFileBase):
 
     @override
     def write_test_out(self, infile: str):
-        p.print_test(solution.exec_file(infile))
+        p.write_answer_from(solution, infile)
 
     @override
     def validate_test_in(self, infile: str):
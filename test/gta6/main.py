@@ -5,11 +5,12 @@
 #   main: T <= 100, A <= 100, B <= 100
 #   bonus: T <= 1e5, A <= 1e12, B <= 1e12
 
-from calico_lib import Problem, cpp_runner, py_runner, TestFileBase, MulticaseTestFile, Subproblem, Runner
+from calico_lib import Problem, cpp_runner, py_runner, TestFileBase, MulticaseTestFile, Subproblem, Runner, InputReader
 from collections.abc import Collection, Iterable
 from typing import NamedTuple
 import random
 import os
+import string
 from os import path
 
 from calico_lib.multicase import TestCaseBase
@@ -55,19 +56,31 @@ class TestFile(TestFileBase):
 
     # @override
     def validate_test_in(self, infile: str):
-        """Verify the test using an external validator."""
+        """Verify the test file with the strict input reader."""
         #if 'main' in self.subproblems:
         #    validator1.exec_file(infile)
         #validator2.exec_file(infile)
-        for c in self.cases:
-            assert c.D >= 1 and c.D <= 31
-            assert c.M >= 1 and c.M <= 12
-            assert c.Y >= 0 and c.Y <= 2200
+        with InputReader(infile) as r:
+            T = r.read_int(1, 100)
+            r.read_eol()
+            for _ in range(T):
+                r.read_line(string.ascii_lowercase + string.digits + " '", maxlen=100, minlen=1)
+                r.read_eol()
+                Y = int(r.read_str(string.digits, 4, 4))
+                r.read_space()
+                M = int(r.read_str(string.digits, 2, 2))
+                r.read_space()
+                D = int(r.read_str(string.digits, 2, 2))
+                r.read_eol()
+                assert 1 <= D <= 31
+                assert 1 <= M <= 12
+                assert 0 <= Y <= 2200
+            r.read_eof()
 
 
     # @override
     def write_test_out(self, infile: str):
-        p.print_test(solution.exec_file(infile))
+        p.write_answer_from(solution, infile)
 
 # adds to all subproblems by default
 p.add_sample_test(TestFile([
@@ -0,0 +1,89 @@
+"""Requests sent to the judge, checked against a local stand-in for the DOMjudge API."""
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+
+import pytest
+
+from calico_lib import Contest, Problem, Subproblem, judge_api
+
+class FakeJudge(BaseHTTPRequestHandler):
+    """Serves GET /contests/<cid>/problems and POST /contests/<cid>/problems/add-data,
+    recording every request in the server's requests list."""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, obj):
+        body = json.dumps(obj).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.requests.append(('GET', self.path, None))
+        self._reply(list(self.server.problems.values()))
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        message = BytesParser(policy=HTTP).parsebytes(
+                b'Content-Type: ' + self.headers['Content-Type'].encode() + b'\r\n\r\n' + body)
+        parts = {part.get_param('name', header='content-disposition'): part.get_content()
+                 for part in message.iter_parts()}
+        data = json.loads(parts['data'])
+        self.server.requests.append(('POST', self.path, data))
+        for problem in data:
+            self.server.problems[problem['id']] = problem
+        self._reply([problem['id'] for problem in data])
+
+@pytest.fixture
+def judge(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeJudge)
+    server.requests = []
+    server.problems = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(judge_api, 'BASE_URL', f'http://127.0.0.1:{server.server_port}')
+    monkeypatch.setattr(judge_api, 'CONTEST_ID', 'test')
+    judge_api.invalidate_contest_problems()
+    yield server
+    server.shutdown()
+    server.server_close()
+    judge_api.invalidate_contest_problems()
+
+def test_register_missing_problems_sends_one_request(judge, tmp_path):
+    problems = []
+    for i in range(3):
+        problem = Problem(f'p{i}', str(tmp_path / f'p{i}'), test_sets=[
+                Subproblem('main', rank=1),
+                Subproblem('bonus', rank=2),
+                ])
+        problem.ordinal = i + 1
+        problems.append(problem)
+    judge.problems['p0_main'] = {'id': 'p0_main', 'label': '1', 'rgb': '#e9e4d7'}
+
+    Contest('test', 'Test', problems=problems).register_missing_problems()
+
+    posts = [request for request in judge.requests if request[0] == 'POST']
+    assert len(posts) == 1
+    _, path, data = posts[0]
+    assert path == '/contests/test/problems/add-data'
+    assert [problem['id'] for problem in data] == [
+            'p0_bonus', 'p1_main', 'p1_bonus', 'p2_main', 'p2_bonus']
+    assert data[1] == {'id': 'p1_main', 'label': '2', 'rgb': '#e9e4d7'}
+    assert data[2] == {'id': 'p1_bonus', 'label': '2b1', 'rgb': '#ff7e34'}
+    # the problems of the contest are fetched once
+    assert len(judge.requests) == 2
+
+def test_register_missing_problems_without_missing_problems(judge, tmp_path):
+    problem = Problem('p', str(tmp_path / 'p'), test_sets=[Subproblem('main', rank=1)])
+    judge.problems['p_main'] = {'id': 'p_main', 'label': 'p_main', 'rgb': '#e9e4d7'}
+
+    Contest('test', 'Test', problems=[problem]).register_missing_problems()
+
+    assert [request[0] for request in judge.requests] == ['GET']
@@ -0,0 +1,37 @@
+import random
+
+import pytest
+
+from calico_lib.problem import _pack
+
+def check_packing(weights, bins, max_cases, max_weight):
+    assert sorted(i for indices in bins for i in indices) == list(range(len(weights)))
+    for indices in bins:
+        assert indices == sorted(indices)
+        assert 0 < len(indices) <= max_cases
+        assert sum(weights[i] for i in indices) <= max_weight
+
+def test_pack_by_count():
+    bins = _pack([1] * 10, 3, float('inf'))
+    check_packing([1] * 10, bins, 3, float('inf'))
+    assert len(bins) == 4
+
+def test_pack_by_weight():
+    weights = [6, 5, 4, 3, 2]
+    bins = _pack(weights, 10, 10)
+    check_packing(weights, bins, 10, 10)
+    # first fit decreasing: 6+4, 5+3+2
+    assert bins == [[0, 2], [1, 3, 4]]
+
+def test_pack_random():
+    rng = random.Random(0)
+    for _ in range(100):
+        weights = [rng.randint(1, 50) for _ in range(rng.randint(0, 200))]
+        max_cases = rng.randint(1, 20)
+        bins = _pack(weights, max_cases, 100)
+        check_packing(weights, bins, max_cases, 100)
+        assert len(bins) >= max(-(-len(weights) // max_cases), -(-sum(weights) // 100))
+
+def test_pack_rejects_heavy_case():
+    with pytest.raises(AssertionError):
+        _pack([1, 11], 5, 10)
@@ -0,0 +1,45 @@
+import threading
+import time
+
+from calico_lib.schedule import Task, critical_path, run_tasks
+
+def test_runs_tasks_after_their_dependencies():
+    order = []
+    a = Task('a', lambda: order.append('a'))
+    b = Task('b', lambda: order.append('b'), [a])
+    c = Task('c', lambda: order.append('c'), [a, b])
+    assert run_tasks([c, b, a], jobs=4)
+    assert order == ['a', 'b', 'c']
+    assert critical_path([a, b, c])[-1] is c
+
+def test_failure_skips_dependents():
+    def fail():
+        raise ValueError('boom')
+    a = Task('a', fail)
+    b = Task('b', lambda: None, [a])
+    c = Task('c', lambda: None, [b])
+    d = Task('d', lambda: None)
+    assert not run_tasks([a, b, c, d], jobs=2)
+    assert [task.status for task in (a, b, c, d)] == ['failed', 'skipped', 'skipped', 'ok']
+    assert 'boom' in a.error
+
+def test_exclusive_task_runs_alone():
+    lock = threading.Lock()
+    running: set[str] = set()
+    seen: list[set[str]] = []
+    def make(name):
+        def fn():
+            with lock:
+                running.add(name)
+                seen.append(set(running))
+            time.sleep(0.05)
+            with lock:
+                running.discard(name)
+        return fn
+    a = Task('a', make('a'))
+    b = Task('b', make('b'))
+    x = Task('x', make('x'), [a], exclusive=True)
+    c = Task('c', make('c'))
+    assert run_tasks([a, b, x, c], jobs=4)
+    assert {'x'} in seen
+    assert all(snapshot == {'x'} for snapshot in seen if 'x' in snapshot)
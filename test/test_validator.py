@@ -0,0 +1,71 @@
+import pytest
+
+from calico_lib import InputReader, ValidationError
+from calico_lib.validator import validate
+
+def reader(tmp_path, data: bytes) -> InputReader:
+    path = tmp_path / 'test.in'
+    path.write_bytes(data)
+    return InputReader(str(path))
+
+def test_reads_valid_input(tmp_path):
+    with reader(tmp_path, b'2\nabc 3 -4\nhello world\n') as r:
+        assert r.read_int(1, 10) == 2
+        r.read_eol()
+        assert r.read_str('abc', 5) == 'abc'
+        r.read_space()
+        assert r.read_ints(2, -10, 10) == [3, -4]
+        r.read_eol()
+        assert r.read_line() == 'hello world'
+        r.read_eol()
+        r.read_eof()
+
+def test_empty_file(tmp_path):
+    with reader(tmp_path, b'') as r:
+        r.read_eof()
+
+@pytest.mark.parametrize('data', [
+        b'01\n',     # leading zero
+        b'-0\n',     # negative zero
+        b'11\n',     # out of range
+        b'1 \n',     # trailing space
+        b'1',        # missing end of line
+        b'1\n\n',    # extra line
+        b'1\r\n',    # carriage return
+        b'1a\n',     # not a whole token
+        ])
+def test_rejects_bad_format(tmp_path, data):
+    with pytest.raises(ValidationError):
+        with reader(tmp_path, data) as r:
+            r.read_int(0, 10)
+            r.read_eol()
+            r.read_eof()
+
+def test_read_ints_reports_bad_integer(tmp_path):
+    with reader(tmp_path, b'1 2 30 4\n') as r:
+        with pytest.raises(ValidationError, match='integer 3 of 4, 30'):
+            r.read_ints(4, 1, 10)
+
+def test_read_int_columns(tmp_path):
+    with reader(tmp_path, b'1 2\n3 4\n5 6\n') as r:
+        assert r.read_int_columns(3, 2, 1, 6) == [[1, 3, 5], [2, 4, 6]]
+        r.read_eof()
+
+@pytest.mark.parametrize('data, message', [
+        (b'1 2\n3  4\n', ':2: expected an integer'),
+        (b'1 2\n3 40\n', ':2: integer 2 of 2, 40'),
+        (b'1 2\n3 4', ':2: expected end of line'),
+        ])
+def test_read_int_columns_reports_line(tmp_path, data, message):
+    with reader(tmp_path, data) as r:
+        with pytest.raises(ValidationError, match=message):
+            r.read_int_columns(2, 2, 1, 10)
+
+def test_validate_requires_eof(tmp_path):
+    path = tmp_path / 'test.in'
+    path.write_bytes(b'1\n2\n')
+    def fn(r):
+        r.read_int(1, 2)
+        r.read_eol()
+    with pytest.raises(ValidationError, match='expected end of file'):
+        validate(str(path), fn)
@@ -0,0 +1,32 @@
+import zipfile
+
+from calico_lib import zipbuild
+
+def test_write_zip_round_trip(tmp_path):
+    (tmp_path / 'data').mkdir()
+    (tmp_path / 'data' / 'a.in').write_bytes(b'1 2\n' * 1000)
+    entries = [
+            zipbuild.compress_file(str(tmp_path / 'data' / 'a.in'), 'data/a.in'),
+            zipbuild.compress_bytes('domjudge-problem.ini', b'name=a\n'),
+            zipbuild.compress_bytes('dossier/été.txt', b''),
+            ]
+    zip_path = tmp_path / 'out.zip'
+    zipbuild.write_zip(str(zip_path), entries)
+
+    with zipfile.ZipFile(zip_path) as zf:
+        assert zf.testzip() is None
+        # sorted by name
+        assert zf.namelist() == ['data/a.in', 'domjudge-problem.ini', 'dossier/été.txt']
+        assert zf.read('data/a.in') == b'1 2\n' * 1000
+        assert zf.read('domjudge-problem.ini') == b'name=a\n'
+        assert zf.read('dossier/été.txt') == b''
+
+def test_write_zip_is_reproducible(tmp_path):
+    (tmp_path / 'a.txt').write_bytes(b'hello\n')
+    first, second = tmp_path / 'first.zip', tmp_path / 'second.zip'
+    zipbuild.write_zip(str(first), [zipbuild.compress_file(str(tmp_path / 'a.txt'), 'a.txt'),
+                                    zipbuild.compress_bytes('b.txt', b'b')])
+    # same entries in another order, compressed again
+    zipbuild.write_zip(str(second), [zipbuild.compress_bytes('b.txt', b'b'),
+                                     zipbuild.compress_file(str(tmp_path / 'a.txt'), 'a.txt')])
+    assert first.read_bytes() == second.read_bytes()